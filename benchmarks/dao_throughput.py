@@ -0,0 +1,238 @@
+"""
+throughput benchmark of explorex.dao against the fake ES server of fake_es.py: docs/sec and peak RSS of the scans,
+the bulk writer and the ESDataProvider methods.
+every case runs in a forked process so its peak RSS is its own, the server keeps running in this process.
+usage (needs the elasticsearch client):
+python benchmarks/dao_throughput.py [--n-docs 100000] [--latency 0.001] [--output dao_throughput.json]
+                                    [--baseline previous.json] [--slack 1.5] [--cases scan_data bulk_insert]
+exits with 1 when a case got slower than slack times its baseline docs/sec.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import sys
+import time
+import traceback
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_es import FakeESServer  # noqa: E402
+
+INDEX, DOC_TYPE = 'bench', 'doc'
+
+
+class _NoTunnel:
+    """
+    the provider talks to the fake server on its local tunnel port directly
+    """
+    is_active = True
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def restart(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+def _provider_conf():
+    from explorex.dao.data_tunnel import BasicTunnel, PortMappingConf
+    BasicTunnel.forwarder = classmethod(lambda cls, port_map: _NoTunnel())
+    return PortMappingConf('dev', 'es')
+
+
+def scan_data(address, opts):
+    from explorex.dao.es_helper import scan_data
+    return len(scan_data(address, INDEX, DOC_TYPE, {'size': opts.page_size}, no_cache=True))
+
+
+def scan_data_pages(address, opts):
+    from explorex.dao.es_helper import scan_data_pages
+    return sum(len(hits) for hits in scan_data_pages(address, INDEX, DOC_TYPE, {'size': opts.page_size},
+                                                     no_cache=True))
+
+
+def scan_data_sliced(address, opts):
+    from explorex.dao.es_helper import scan_data_sliced
+    return sum(len(hits) for hits in scan_data_sliced(address, INDEX, DOC_TYPE, {'size': opts.page_size},
+                                                      opts.n_slices, no_cache=True))
+
+
+def scan_data_projected(address, opts):
+    from explorex.dao.es_helper import scan_data_projected
+    return sum(len(hits) for hits in scan_data_projected(address, INDEX, DOC_TYPE, {'size': opts.page_size},
+                                                         columns=['user.name', 'ts'], no_cache=True))
+
+
+def scan_data_frames(address, opts):
+    from explorex.dao.es_helper import scan_data_frames
+    return sum(len(df) for df in scan_data_frames(address, INDEX, DOC_TYPE, {'size': opts.page_size},
+                                                  pages_per_frame=50, no_cache=True))
+
+
+def bulk_insert(address, opts):
+    from explorex.dao.es_helper import batch_insert_data
+    from fake_es import make_doc
+    docs = ({'_id': str(i), '_source': make_doc(i)} for i in range(opts.n_docs))
+    stats = batch_insert_data(address, 'bench_out', DOC_TYPE, docs, n_jobs=opts.n_jobs, initial_backoff=0.01)
+    return sum(c['ok'] for c in stats)
+
+
+def provider_scan(address, opts):
+    from explorex.dao.es_helper import ESDataProvider
+    _provider_conf()
+    provider = ESDataProvider('dev')
+    return sum(len(hits) for hits in provider._scan_pages(INDEX, DOC_TYPE, {'size': opts.page_size}))
+
+
+def provider_get(address, opts):
+    from explorex.dao.es_helper import ESDataProvider
+    _provider_conf()
+    provider = ESDataProvider('dev')
+    n = min(opts.n_docs, opts.n_gets)
+    for i in range(n):
+        provider._get(INDEX, DOC_TYPE, str(i))
+    return n
+
+
+def provider_search(address, opts):
+    from explorex.dao.es_helper import ESDataProvider
+    _provider_conf()
+    provider = ESDataProvider('dev')
+    n = 0
+    for _ in range(opts.n_searches):
+        n += len(provider._search(INDEX, DOC_TYPE, {'size': opts.page_size})['hits']['hits'])
+    return n
+
+
+def async_provider_get(address, opts):
+    from explorex.dao.async_es_helper import AsyncESDataProvider
+    _provider_conf()
+    n = min(opts.n_docs, opts.n_gets)
+
+    async def run():
+        async with AsyncESDataProvider('dev') as provider:
+            docs = await asyncio.gather(*[provider._get(INDEX, DOC_TYPE, str(i)) for i in range(n)])
+        return sum(d['found'] for d in docs)
+
+    return asyncio.run(run())
+
+
+CASES = {
+    'scan_data': scan_data,
+    'scan_data_pages': scan_data_pages,
+    'scan_data_sliced': scan_data_sliced,
+    'scan_data_projected': scan_data_projected,
+    'scan_data_frames': scan_data_frames,
+    'bulk_insert': bulk_insert,
+    'provider_scan': provider_scan,
+    'provider_get': provider_get,
+    'provider_search': provider_search,
+    'async_provider_get': async_provider_get,
+}
+
+
+def _run_case(queue, name, address, opts):
+    try:
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            start = time.time()
+            docs = CASES[name](address, opts)
+            seconds = time.time() - start
+        queue.put({'docs': docs, 'seconds': seconds, 'docs_per_sec': docs / seconds if seconds > 0 else None,
+                   # kilobytes on linux
+                   'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0})
+    except Exception:
+        queue.put({'error': traceback.format_exc()})
+
+
+def run_case(name, address, opts):
+    ctx = mp.get_context('fork')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_run_case, args=(queue, name, address, opts))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def run(opts):
+    results = {}
+    # the provider connects to the local port of its tunnel conf, the fake server listens there
+    from explorex.dao.data_tunnel import PortMappingConf
+    port = PortMappingConf('dev', 'es').local_addr_port
+    with FakeESServer(n_docs=opts.n_docs, latency=opts.latency, port=port) as server:
+        for name in opts.cases:
+            results[name] = run_case(name, server.address, opts)
+            result = results[name]
+            if 'error' in result:
+                print("{:22s} failed\n{}".format(name, result['error']))
+            else:
+                print("{:22s} {:10.0f} docs/s  {:8.1f} MB peak RSS  ({} docs in {:.2f}s)".format(
+                    name, result['docs_per_sec'] or 0, result['peak_rss_mb'], result['docs'], result['seconds']))
+    return results
+
+
+def regressions(results, baseline, slack):
+    failures = []
+    for name, result in results.items():
+        if 'error' in result:
+            failures.append("{} failed".format(name))
+            continue
+        previous = baseline.get(name, {}).get('docs_per_sec')
+        if previous and result['docs_per_sec'] * slack < previous:
+            failures.append("{} ran at {:.0f} docs/s, baseline {:.0f} docs/s".format(
+                name, result['docs_per_sec'], previous))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--n-docs', type=int, default=100000)
+    parser.add_argument('--latency', type=float, default=0.001, help='seconds added to every request')
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--n-slices', type=int, default=4)
+    parser.add_argument('--n-jobs', type=int, default=4, help='bulk writer threads')
+    parser.add_argument('--n-gets', type=int, default=5000)
+    parser.add_argument('--n-searches', type=int, default=100)
+    parser.add_argument('--cases', nargs='+', default=list(CASES), choices=list(CASES))
+    parser.add_argument('--output', default='dao_throughput.json')
+    parser.add_argument('--baseline', help='json output of a previous run')
+    parser.add_argument('--slack', type=float, default=1.5, help='allowed slowdown factor against the baseline')
+    opts = parser.parse_args()
+
+    results = run(opts)
+    report = {
+        'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                 'platform': platform.platform(), 'cpu_count': mp.cpu_count(),
+                 'options': {k: v for k, v in vars(opts).items() if k not in ('output', 'baseline')}},
+        'results': results
+    }
+    with open(opts.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    baseline = {}
+    if opts.baseline:
+        with open(opts.baseline) as f:
+            baseline = json.load(f).get('results', {})
+    failures = regressions(results, baseline, opts.slack)
+    for failure in failures:
+        print("REGRESSION: {}".format(failure))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,315 @@
+"""
+in-process stand-in for an Elasticsearch HTTP server, serving synthetic documents so explorex.dao can be exercised and
+measured without a cluster.
+supported: search (with scroll, search_type=scan, slice, _source includes, docvalue_fields), scroll, clear scroll,
+bulk, get and mget. every index holds the same n_docs synthetic documents (ids '0' .. str(n_docs - 1)), the documents
+indexed through bulk are kept per index and served by get / mget. queries are not evaluated, every search matches all
+the synthetic documents.
+e.g.:
+with FakeESServer(n_docs=100000, latency=0.002) as server:
+    es = Elasticsearch([server.address])
+"""
+
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+VERSION = '7.17.0'
+
+
+def make_doc(i, n_fields=10):
+    """
+    deterministic synthetic document number i, n_fields padding string fields make the documents wider
+    """
+    doc = {
+        'n': i,
+        'x': (i * 7919 % 10007) / 10007.0,
+        'cat': 'c{}'.format(i % 16),
+        'ts': 1500000000000 + 1000 * i,
+        'user': {'name': 'u{}'.format(i % 1000), 'age': 18 + i % 60}
+    }
+    for k in range(n_fields):
+        doc['f{}'.format(k)] = 'value_{}_{}'.format(k, i % 97)
+    return doc
+
+
+def _get_path(doc, field):
+    for part in field.split('.'):
+        if not isinstance(doc, dict) or part not in doc:
+            return None
+        doc = doc[part]
+    return doc
+
+
+def _project(doc, includes):
+    projected = {}
+    for field in includes:
+        value = _get_path(doc, field)
+        if value is None:
+            continue
+        node = projected
+        parts = field.split('.')
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = value
+    return projected
+
+
+class _Scroll:
+    def __init__(self, ids, size, source, docvalue_fields):
+        self.ids = ids
+        self.pos = 0
+        self.size = size
+        self.source = source
+        self.docvalue_fields = docvalue_fields
+
+
+class FakeESServer:
+    def __init__(self, n_docs=10000, n_fields=10, latency=0.0, max_page_size=10000, reject_rate=0.0, host='127.0.0.1',
+                 port=0):
+        """
+        :param n_docs: synthetic documents per index
+        :param n_fields: padding fields per document
+        :param latency: seconds added to every request
+        :param max_page_size: upper bound of the size of a page, whatever the query asks for
+        :param reject_rate: fraction of the bulk items rejected with a 429, every n-th item deterministically
+        :param port: 0 picks a free port
+        """
+        self.n_docs = n_docs
+        self.n_fields = n_fields
+        self.latency = latency
+        self.max_page_size = max_page_size
+        self.reject_rate = reject_rate
+        self.indexed = {}
+        self.scrolls = {}
+        self.stats = {'requests': 0, 'search': 0, 'scroll': 0, 'clear_scroll': 0, 'bulk': 0, 'get': 0, 'mget': 0}
+        self._lock = threading.Lock()
+        self._bulk_items = 0
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        host, port = self._httpd.server_address[:2]
+        return "{}:{}".format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _count(self, name):
+        with self._lock:
+            self.stats['requests'] += 1
+            if name:
+                self.stats[name] += 1
+
+    def _doc(self, index, doc_id):
+        doc = self.indexed.get(index, {}).get(doc_id)
+        if doc is not None:
+            return doc
+        if doc_id.isdigit() and int(doc_id) < self.n_docs:
+            return make_doc(int(doc_id), self.n_fields)
+        return None
+
+    def _hit(self, index, doc_type, doc_id, doc, source, docvalue_fields):
+        hit = {'_index': index, '_type': doc_type, '_id': doc_id, '_score': 1.0}
+        if source is not False:
+            hit['_source'] = doc if source is None else _project(doc, source)
+        if docvalue_fields:
+            hit['fields'] = {f: [_get_path(doc, f)] for f in docvalue_fields if _get_path(doc, f) is not None}
+        return hit
+
+    def _page(self, index, doc_type, scroll):
+        ids = scroll.ids[scroll.pos:scroll.pos + scroll.size]
+        scroll.pos += len(ids)
+        return [self._hit(index, doc_type, str(i), make_doc(i, self.n_fields), scroll.source, scroll.docvalue_fields)
+                for i in ids]
+
+    # request handlers, each returns (status, body)
+
+    def search(self, index, doc_type, params, body):
+        body = body or {}
+        size = min(int(params.get('size', body.get('size', 10))), self.max_page_size)
+        ids = range(self.n_docs)
+        if 'slice' in body:
+            ids = range(body['slice']['id'], self.n_docs, body['slice']['max'])
+        source = body.get('_source')
+        if isinstance(source, dict):
+            source = source.get('includes')
+        elif isinstance(source, str):
+            source = [source]
+        scroll = _Scroll(ids, size, source, body.get('docvalue_fields'))
+        res = {'took': 1, 'timed_out': False, 'hits': {'total': {'value': len(ids), 'relation': 'eq'}, 'hits': []}}
+        if params.get('search_type') != 'scan':
+            res['hits']['hits'] = self._page(index, doc_type, scroll)
+        if 'scroll' in params:
+            scroll_id = uuid.uuid4().hex
+            with self._lock:
+                self.scrolls[scroll_id] = (index, doc_type, scroll)
+            res['_scroll_id'] = scroll_id
+        return 200, res
+
+    def scroll(self, params, body):
+        scroll_id = (body or {}).get('scroll_id') or params.get('scroll_id')
+        with self._lock:
+            context = self.scrolls.get(scroll_id)
+        if context is None:
+            return 404, {'error': 'search_context_missing_exception', 'status': 404}
+        index, doc_type, scroll = context
+        hits = self._page(index, doc_type, scroll)
+        return 200, {'_scroll_id': scroll_id, 'took': 1, 'timed_out': False,
+                     'hits': {'total': {'value': len(scroll.ids), 'relation': 'eq'}, 'hits': hits}}
+
+    def clear_scroll(self, params, body):
+        scroll_ids = (body or {}).get('scroll_id') or params.get('scroll_id') or []
+        if isinstance(scroll_ids, str):
+            scroll_ids = scroll_ids.split(',')
+        freed = 0
+        with self._lock:
+            for scroll_id in scroll_ids:
+                freed += self.scrolls.pop(scroll_id, None) is not None
+        return 200, {'succeeded': True, 'num_freed': freed}
+
+    def bulk(self, index, doc_type, raw):
+        lines = [line for line in raw.decode('utf-8').split('\n') if line.strip()]
+        items, errors = [], False
+        every = int(round(1 / self.reject_rate)) if self.reject_rate > 0 else 0
+        for action_line, source_line in zip(lines[::2], lines[1::2]):
+            action = json.loads(action_line)
+            op, meta = next(iter(action.items()))
+            target = meta.get('_index', index)
+            with self._lock:
+                self._bulk_items += 1
+                rejected = every and self._bulk_items % every == 0
+                if not rejected:
+                    doc_id = meta.get('_id') or uuid.uuid4().hex
+                    self.indexed.setdefault(target, {})[str(doc_id)] = json.loads(source_line)
+            if rejected:
+                errors = True
+                items.append({op: {'_index': target, 'status': 429,
+                                   'error': {'type': 'es_rejected_execution_exception'}}})
+            else:
+                items.append({op: {'_index': target, '_id': str(doc_id), 'status': 201, 'result': 'created'}})
+        return 200, {'took': 1, 'errors': errors, 'items': items}
+
+    def get(self, index, doc_type, doc_id):
+        doc = self._doc(index, doc_id)
+        if doc is None:
+            return 404, {'_index': index, '_type': doc_type, '_id': doc_id, 'found': False}
+        return 200, {'_index': index, '_type': doc_type, '_id': doc_id, 'found': True, '_source': doc}
+
+    def mget(self, index, doc_type, body):
+        if 'ids' in body:
+            requests = [(index, str(i)) for i in body['ids']]
+        else:
+            requests = [(d.get('_index', index), str(d['_id'])) for d in body['docs']]
+        docs = []
+        for doc_index, doc_id in requests:
+            doc = self._doc(doc_index, doc_id)
+            res = {'_index': doc_index, '_type': doc_type, '_id': doc_id, 'found': doc is not None}
+            if doc is not None:
+                res['_source'] = doc
+            docs.append(res)
+        return 200, {'docs': docs}
+
+    def route(self, method, path, params, raw):
+        """
+        :return: (status, body, name of the operation)
+        """
+        parts = [p for p in path.split('/') if p]
+        body = None
+        if raw and not parts[-1:] == ['_bulk']:
+            body = json.loads(raw.decode('utf-8'))
+
+        if not parts:
+            return 200, {'name': 'fake', 'cluster_name': 'fake', 'version': {
+                'number': VERSION, 'build_flavor': 'default', 'lucene_version': '8.11.1'},
+                'tagline': 'You Know, for Search'}, None
+        if parts[:2] == ['_search', 'scroll']:
+            if method == 'DELETE':
+                return self.clear_scroll(params, body) + ('clear_scroll',)
+            return self.scroll(params, body) + ('scroll',)
+        if parts[-1] == '_search':
+            index = parts[0] if len(parts) > 1 else '_all'
+            doc_type = parts[1] if len(parts) > 2 else '_doc'
+            return self.search(index, doc_type, params, body) + ('search',)
+        if parts[-1] == '_bulk':
+            index = parts[0] if len(parts) > 1 else None
+            doc_type = parts[1] if len(parts) > 2 else '_doc'
+            return self.bulk(index, doc_type, raw) + ('bulk',)
+        if parts[-1] == '_mget':
+            index = parts[0] if len(parts) > 1 else None
+            doc_type = parts[1] if len(parts) > 2 else '_doc'
+            return self.mget(index, doc_type, body) + ('mget',)
+        if method in ('GET', 'HEAD') and len(parts) in (2, 3):
+            index, doc_id = parts[0], parts[-1]
+            doc_type = parts[1] if len(parts) == 3 else '_doc'
+            return self.get(index, doc_type, doc_id) + ('get',)
+        return 400, {'error': 'unsupported request {} {}'.format(method, path), 'status': 400}, None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body are written separately, without this keep-alive requests stall on delayed acks
+            disable_nagle_algorithm = True
+
+            def _serve(self):
+                url = urlparse(self.path)
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                raw = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if server.latency:
+                    time.sleep(server.latency)
+                try:
+                    status, body, name = server.route(self.command, url.path, params, raw)
+                except Exception as e:
+                    status, body, name = 500, {'error': repr(e), 'status': 500}, None
+                server._count(name)
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('X-Elastic-Product', 'Elasticsearch')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(payload)
+
+            do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _serve
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='serve synthetic documents over a fake Elasticsearch API')
+    parser.add_argument('--port', type=int, default=9200)
+    parser.add_argument('--n-docs', type=int, default=100000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    args = parser.parse_args()
+    with FakeESServer(n_docs=args.n_docs, latency=args.latency, port=args.port) as fake:
+        print("fake ES listening on {}".format(fake.address))
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,126 @@
+"""
+import time benchmark of the explorex modules, guarding against heavy dependencies creeping back into module level
+imports.
+every module is imported in a fresh interpreter, the import time is measured there and the heavy modules found in
+sys.modules afterwards are compared with the ones the module is allowed to load.
+usage:
+python benchmarks/import_time.py [--repeat 5] [--output import_time.json] [--baseline previous.json] [--slack 1.5]
+exits with 1 when a forbidden module is imported, or when an import got slower than slack times the baseline.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = ['numpy', 'pandas', 'scipy', 'matplotlib', 'sshtunnel', 'paramiko', 'yaml', 'elasticsearch']
+
+# module -> heavy modules it may load at import time
+ALLOWED = {
+    'explorex.conf': [],
+    'explorex.dao.data_tunnel': [],
+    'explorex.utils.operator_util': [],
+    'explorex.utils.basic_util': [],
+    'explorex.utils.dataframe_util': [],
+    'explorex.utils.aggregation_util': [],
+    'explorex.utils.file_util': [],
+    'explorex.utils.parallel_scheduler': [],
+    'explorex.utils.pipeline': ['numpy'],
+    'explorex.cluster.spatial_index': ['numpy'],
+    'explorex.cluster.k_means_': ['numpy'],
+    'explorex.cluster.non_parametric': ['numpy'],
+    'explorex.cluster.dp_mixture': ['numpy'],
+    'explorex.cluster.chain_runner': ['numpy'],
+    'explorex.cluster.out_of_core': ['numpy'],
+    'explorex.utils.frame_builder': [],
+    'explorex.dao.projection': [],
+    'explorex.utils.record_store': [],
+    'explorex.dao.es_helper': ['elasticsearch'],
+    'explorex.dao.async_es_helper': ['elasticsearch'],
+}
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def probe(module):
+    """
+    :return: dict of the import time in seconds and the heavy modules loaded, or of the error if the import fails
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')])))
+    proc = subprocess.run([sys.executable, '-c', _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, universal_newlines=True)
+    if proc.returncode != 0:
+        return {'error': proc.stderr.strip().splitlines()[-1]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run(modules, repeat=5):
+    """
+    :return: module -> {'seconds': best import time, 'loaded': heavy modules, 'forbidden': loaded but not allowed}
+    """
+    results = {}
+    for module in modules:
+        runs = [probe(module) for _ in range(repeat)]
+        if 'error' in runs[0]:
+            # e.g. an optional dependency such as elasticsearch is not installed
+            results[module] = {'skipped': runs[0]['error']}
+            continue
+        loaded = runs[0]['loaded']
+        results[module] = {
+            'seconds': min(r['seconds'] for r in runs),
+            'loaded': loaded,
+            'forbidden': [m for m in loaded if m not in ALLOWED[module]]
+        }
+    return results
+
+
+def regressions(results, baseline, slack):
+    failures = []
+    for module, result in results.items():
+        if 'skipped' in result:
+            continue
+        if result['forbidden']:
+            failures.append("{} imports {}".format(module, ', '.join(result['forbidden'])))
+        previous = baseline.get(module, {}).get('seconds')
+        if previous and result['seconds'] > slack * previous:
+            failures.append("{} import took {:.3f}s, baseline {:.3f}s".format(module, result['seconds'], previous))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default='import_time.json')
+    parser.add_argument('--baseline', help='json output of a previous run')
+    parser.add_argument('--slack', type=float, default=1.5, help='allowed slowdown factor against the baseline')
+    args = parser.parse_args()
+
+    results = run(ALLOWED, args.repeat)
+    for module, result in results.items():
+        if 'skipped' in result:
+            print("{:40s} skipped ({})".format(module, result['skipped']))
+        else:
+            print("{:40s} {:8.1f} ms  {}".format(module, 1000 * result['seconds'], ', '.join(result['loaded'])))
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    failures = regressions(results, baseline, args.slack)
+    for failure in failures:
+        print("REGRESSION: {}".format(failure))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+query time of the spatial indexes of explorex.cluster.spatial_index against brute force, over the number of reference
+points k and the dimension d, for query points drawn around the reference points (fitted centroids) and uniformly.
+used to pick spatial_index.KD_TREE_MAX_DIM and k_means_.INDEX_MIN_CLUSTERS.
+usage:
+python benchmarks/spatial_index.py [--n-points 200000] [--k 64 256 1024] [--dims 2 4 8 16 32 40]
+                                   [--kinds kd_tree ball_tree brute] [--output spatial_index.json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from explorex.cluster.spatial_index import build_index  # noqa: E402
+
+
+def make_points(n, k, d, clustered, rng):
+    centers = rng.uniform(-10, 10, size=(k, d))
+    if clustered:
+        points = centers[rng.integers(k, size=n)] + rng.normal(scale=0.5, size=(n, d))
+    else:
+        points = rng.uniform(-10, 10, size=(n, d))
+    return centers, points
+
+
+def time_query(kind, centers, points, repeat):
+    """
+    :return: best seconds of building the index and querying all the points
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        build_index(centers, kind).query(points)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(opts):
+    rng = np.random.default_rng(opts.seed)
+    results = []
+    for clustered in [True, False]:
+        for d in opts.dims:
+            for k in opts.k:
+                centers, points = make_points(opts.n_points, k, d, clustered, rng)
+                row = {'clustered': clustered, 'd': d, 'k': k}
+                for kind in opts.kinds:
+                    row[kind] = time_query(kind, centers, points, opts.repeat)
+                results.append(row)
+                print("{:9s} d={:<3d} k={:<5d} ".format('clustered' if clustered else 'uniform', d, k) +
+                      "  ".join("{} {:7.3f}s".format(kind, row[kind]) for kind in opts.kinds))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--n-points', type=int, default=200000)
+    parser.add_argument('--k', type=int, nargs='+', default=[64, 256, 1024])
+    parser.add_argument('--dims', type=int, nargs='+', default=[2, 4, 8, 16, 32, 40])
+    parser.add_argument('--kinds', nargs='+', default=['kd_tree', 'ball_tree', 'brute'])
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='spatial_index.json')
+    opts = parser.parse_args()
+    with open(opts.output, 'w') as f:
+        json.dump(run(opts), f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""
+run several chains of a sampler in parallel processes with independent, reproducible random streams.
+
+a sampler is any picklable callable sampler(rng, **kwargs) returning an iterable of samples, a sample being a
+number or a 1-d array of statistics. every chain gets its own numpy Generator spawned from one SeedSequence, so a
+chain only depends on the seed and its index, never on scheduling. samples are streamed back in small blocks as
+they are produced and the R-hat / effective sample size diagnostics can be read at any time.
+e.g.:
+def num_tables(rng, num_customers, alpha):
+    while True:
+        yield crp_table_assignments(num_customers, alpha, random_state=rng).max() + 1
+
+runner = ChainRunner(num_tables, n_chains=4, seed=0, num_customers=1000, alpha=2)
+for chain, i, sample in runner.run(n_samples=2000):
+    if i % 500 == 0:
+        print(runner.diagnostics.rhat(), runner.diagnostics.ess())
+"""
+
+import multiprocessing as mp
+import os
+import queue as queue_module
+import traceback
+from itertools import islice
+
+import numpy as np
+
+_STARTED = 'started'
+_DONE = 'done'
+_ERROR = 'error'
+
+
+def _run_chain(queue, sampler, chain, seed, n_samples, block_size, kwargs):
+    queue.put((chain, _STARTED, os.getpid()))
+    try:
+        rng = np.random.default_rng(seed)
+        block, start = [], 0
+        for sample in islice(sampler(rng, **kwargs), n_samples):
+            block.append(sample)
+            if len(block) == block_size:
+                queue.put((chain, start, block))
+                start += len(block)
+                block = []
+        if block:
+            queue.put((chain, start, block))
+        queue.put((chain, _DONE, None))
+    except Exception:
+        queue.put((chain, _ERROR, traceback.format_exc()))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class ChainDiagnostics:
+    """
+    collects the samples of every chain and computes convergence diagnostics over the common length of the chains,
+    per statistic when the samples are arrays
+    """
+
+    def __init__(self, n_chains):
+        self.samples = [[] for _ in range(n_chains)]
+
+    def update(self, chain, samples):
+        self.samples[chain].extend(np.atleast_1d(np.asarray(s, dtype=float)) for s in samples)
+
+    def _draws(self):
+        """
+        :return: (n_chains, n, n_stats) array truncated to the shortest chain
+        """
+        n = min(len(s) for s in self.samples)
+        if n < 4:
+            return None
+        return np.array([s[:n] for s in self.samples])
+
+    def rhat(self):
+        """
+        split R-hat (Gelman et al.): every chain is cut in two halves, values close to 1 mean the chains agree
+        :return: R-hat per statistic, nan while there are fewer than 4 draws per chain
+        """
+        draws = self._draws()
+        if draws is None:
+            return np.nan
+        half = draws.shape[1] // 2
+        split = np.concatenate([draws[:, :half], draws[:, half:2 * half]])
+        n = split.shape[1]
+        chain_means = split.mean(axis=1)
+        within = split.var(axis=1, ddof=1).mean(axis=0)
+        between = n * chain_means.var(axis=0, ddof=1)
+        var_plus = (n - 1) / n * within + between / n
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.sqrt(var_plus / within)
+
+    def ess(self):
+        """
+        multi-chain effective sample size with Geyer's initial positive sequence on the combined autocorrelation
+        :return: effective sample size per statistic, nan while there are fewer than 4 draws per chain
+        """
+        draws = self._draws()
+        if draws is None:
+            return np.nan
+        m, n, _ = draws.shape
+        centered = draws - draws.mean(axis=1, keepdims=True)
+        # autocovariance of every chain through the fft, zero padded to avoid circular wrap
+        size = 2 ** int(np.ceil(np.log2(2 * n)))
+        spectrum = np.fft.rfft(centered, n=size, axis=1)
+        acov = np.fft.irfft(spectrum * np.conj(spectrum), n=size, axis=1)[:, :n] / n
+
+        within = (acov[:, 0] * n / (n - 1)).mean(axis=0)
+        var_plus = within * (n - 1) / n
+        if m > 1:
+            var_plus = var_plus + draws.mean(axis=1).var(axis=0, ddof=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rho = 1 - (within - acov.mean(axis=0)) / var_plus
+
+        result = np.empty(rho.shape[1])
+        for s in range(rho.shape[1]):
+            # sum the autocorrelations in pairs while the pair sums stay positive
+            total = 0.0
+            for t in range(0, n - 1, 2):
+                pair = rho[t, s] + rho[t + 1, s]
+                if not pair > 0:
+                    break
+                total += pair
+            tau = -1 + 2 * total if total > 0 else 1.0
+            result[s] = m * n / max(tau, 1.0 / np.log10(max(m * n, 10)))
+        return result
+
+
+class ChainRunner:
+    def __init__(self, sampler, n_chains=4, seed=None, n_jobs=None, block_size=50, poll_interval=1.0, **kwargs):
+        """
+        :param sampler: picklable callable sampler(rng, **kwargs) returning an iterable of samples
+        :param n_chains: number of chains
+        :param seed: seed of the SeedSequence every chain stream is spawned from
+        :param n_jobs: processes, one per chain up to the cpu count if not set
+        :param block_size: samples sent back per message
+        :param poll_interval: seconds between checks of chains that failed without reporting it, e.g. an
+        unpicklable sampler or a killed worker
+        :param kwargs: passed to the sampler
+        """
+        self.sampler = sampler
+        self.n_chains = n_chains
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.n_jobs = n_jobs
+        self.block_size = block_size
+        self.poll_interval = poll_interval
+        self.kwargs = kwargs
+        self.diagnostics = ChainDiagnostics(n_chains)
+
+    def run(self, n_samples):
+        """
+        :param n_samples: samples per chain
+        :return: generator of (chain, sample index, sample), in the order samples arrive from the chains
+        """
+        seeds = self.seed_sequence.spawn(self.n_chains)
+        self.diagnostics = ChainDiagnostics(self.n_chains)
+        n_jobs = min(self.n_chains, self.n_jobs or mp.cpu_count())
+        with mp.Manager() as manager, mp.Pool(n_jobs) as pool:
+            queue = manager.Queue()
+            results = [pool.apply_async(_run_chain, (queue, self.sampler, chain, seed, n_samples, self.block_size,
+                                                     self.kwargs))
+                       for chain, seed in enumerate(seeds)]
+            running = set(range(self.n_chains))
+            pids = {}
+            while running:
+                try:
+                    chain, start, block = queue.get(timeout=self.poll_interval)
+                except queue_module.Empty:
+                    self._check_chains(running, results, pids)
+                    continue
+                if start == _STARTED:
+                    pids[chain] = block
+                    continue
+                if start == _DONE:
+                    running.discard(chain)
+                    continue
+                if start == _ERROR:
+                    raise RuntimeError("chain {} failed:\n{}".format(chain, block))
+                self.diagnostics.update(chain, block)
+                for i, sample in enumerate(block):
+                    yield chain, start + i, sample
+
+    @staticmethod
+    def _check_chains(running, results, pids):
+        """
+        raise for the chains that can no longer report: their task failed outside of the sampler (e.g. it could not
+        be pickled) or their worker process died (e.g. killed by the OOM killer)
+        """
+        for chain in sorted(running):
+            result = results[chain]
+            if result.ready() and not result.successful():
+                try:
+                    result.get()
+                except Exception as e:
+                    raise RuntimeError("chain {} could not run: {!r}".format(chain, e)) from e
+            if chain in pids and not result.ready() and not _pid_alive(pids[chain]):
+                raise RuntimeError("the worker of chain {} (pid {}) died".format(chain, pids[chain]))
+
+    def run_all(self, n_samples):
+        """
+        :return: (n_chains, n_samples, ...) array of all the samples
+        """
+        samples = [[None] * n_samples for _ in range(self.n_chains)]
+        for chain, i, sample in self.run(n_samples):
+            samples[chain][i] = sample
+        return np.array(samples)
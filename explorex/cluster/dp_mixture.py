@@ -0,0 +1,250 @@
+"""
+clustering with an unknown number of clusters on top of the dirichlet process priors of non_parametric:
+DPGaussianMixture, a collapsed gibbs sampler for a dirichlet process mixture of diagonal gaussians, and DPMeans,
+its small variance hard assignment limit for fast large-n runs.
+"""
+
+from math import lgamma, log, pi
+
+import numpy as np
+
+from explorex.cluster.k_means_ import assign_clusters, update_means
+from explorex.cluster.non_parametric import crp_table_assignments
+
+
+class DPGaussianMixture:
+    """
+    dirichlet process mixture of gaussians with a diagonal covariance and a conjugate normal-gamma prior per dimension,
+    mean ~ N(mu0, 1 / (kappa0 * precision)), precision ~ Gamma(a0, b0).
+    the means and precisions are integrated out, a sweep moves every point given the others:
+    p(z_i = k | rest) ~ n_k * student_t(x_i | cluster k)  and  p(new cluster) ~ alpha * student_t(x_i | prior).
+    every cluster keeps its sufficient statistics (count, sum, sum of squares) together with the parameters of its
+    predictive student t, and only the two clusters touched by a move are updated, so a sweep costs O(n * K * d).
+    e.g.:
+    dp = DPGaussianMixture(alpha=1, random_state=0).fit(points)
+    dp.labels_, dp.n_clusters_, dp.means_
+    """
+
+    def __init__(self, alpha=1.0, n_sweeps=50, mu0=None, kappa0=0.01, a0=1.0, b0=None, random_state=None):
+        """
+        :param alpha: concentration parameter
+        :param n_sweeps: number of gibbs sweeps over the data
+        :param mu0: prior mean, the data mean if not set
+        :param kappa0: prior pseudo count of the mean
+        :param a0: prior shape of the precision
+        :param b0: prior rate of the precision, a0 * data variance / 10 per dimension if not set, i.e. clusters are
+        expected to be about ten times tighter than the whole data
+        :param random_state: seed or numpy Generator
+        """
+        self.alpha = alpha
+        self.n_sweeps = n_sweeps
+        self.mu0 = mu0
+        self.kappa0 = kappa0
+        self.a0 = a0
+        self.b0 = b0
+        self.random_state = random_state
+
+    def _allocate(self, capacity, dim):
+        self._counts = np.zeros(capacity)
+        self._sums = np.zeros((capacity, dim))
+        self._sumsq = np.zeros((capacity, dim))
+        self._loc = np.zeros((capacity, dim))
+        self._scale = np.ones((capacity, dim))
+        self._norm = np.full(capacity, -np.inf)
+        self._power = np.ones(capacity)
+        self._free = list(range(capacity - 1, -1, -1))
+
+    def _grow(self):
+        capacity, dim = self._sums.shape
+        for name in ['_counts', '_sums', '_sumsq', '_loc', '_scale', '_norm', '_power']:
+            old = getattr(self, name)
+            new = np.empty((2 * capacity,) + old.shape[1:])
+            new[:capacity] = old
+            new[capacity:] = {'_norm': -np.inf, '_scale': 1, '_power': 1}.get(name, 0)
+            setattr(self, name, new)
+        self._free += list(range(2 * capacity - 1, capacity - 1, -1))
+
+    def _predictive(self, count, total, total_sq):
+        """
+        parameters of the student t posterior predictive of a cluster with the given sufficient statistics:
+        log p(x) = norm - power * sum_d log(1 + (x_d - loc_d)^2 / scale_d)
+        """
+        kappa_n = self.kappa0 + count
+        mean = total / count if count > 0 else 0.0
+        loc = (self.kappa0 * self._mu0 + total) / kappa_n
+        a_n = self.a0 + count / 2.0
+        b_n = self._b0 + 0.5 * (total_sq - count * mean ** 2) + \
+            self.kappa0 * count * (mean - self._mu0) ** 2 / (2 * kappa_n)
+        dof = 2 * a_n
+        # dof * sigma^2 of the student t
+        scale = 2 * b_n * (kappa_n + 1) / kappa_n
+        norm = len(loc) * (lgamma((dof + 1) / 2) - lgamma(dof / 2) - 0.5 * log(pi)) - 0.5 * np.sum(np.log(scale))
+        return loc, scale, norm, (dof + 1) / 2
+
+    def _refresh(self, k):
+        self._loc[k], self._scale[k], self._norm[k], self._power[k] = self._predictive(
+            self._counts[k], self._sums[k], self._sumsq[k])
+
+    def _add(self, k, x):
+        self._counts[k] += 1
+        self._sums[k] += x
+        self._sumsq[k] += x * x
+        self._refresh(k)
+
+    def _remove(self, k, x):
+        self._counts[k] -= 1
+        if self._counts[k] == 0:
+            self._sums[k] = 0
+            self._sumsq[k] = 0
+            self._norm[k] = -np.inf
+            self._free.append(k)
+        else:
+            self._sums[k] -= x
+            self._sumsq[k] -= x * x
+            self._refresh(k)
+
+    def _log_predictive(self, x):
+        return self._norm - self._power * np.sum(np.log1p((x - self._loc) ** 2 / self._scale), axis=1)
+
+    def _sweep(self, X, labels, rng):
+        prior_loc, prior_scale, prior_norm, prior_power = self._prior
+        log_alpha = log(self.alpha)
+        for i in rng.permutation(len(X)):
+            x = X[i]
+            self._remove(labels[i], x)
+
+            log_weight = np.log(self._counts) + self._log_predictive(x)
+            log_new = log_alpha + prior_norm - prior_power * np.sum(np.log1p((x - prior_loc) ** 2 / prior_scale))
+            top = max(log_weight.max(), log_new)
+            weight = np.exp(log_weight - top)
+            cumulative = np.cumsum(weight)
+            u = rng.random() * (cumulative[-1] + np.exp(log_new - top))
+
+            if u < cumulative[-1]:
+                k = min(int(np.searchsorted(cumulative, u, side='right')), len(cumulative) - 1)
+            else:
+                if not self._free:
+                    self._grow()
+                k = self._free.pop()
+            labels[i] = k
+            self._add(k, x)
+
+    def sweeps(self, X):
+        """
+        run the sampler lazily, after every sweep the current state is exposed through labels_ / n_clusters_ ...
+        e.g. to be driven by chain_runner.ChainRunner
+        :return: generator of the number of clusters after every sweep, n_sweeps of them
+        """
+        X = np.asarray(X, dtype=float)
+        if X.ndim != 2:
+            raise ValueError("expected an (n, d) array, got shape {}".format(X.shape))
+        rng = np.random.default_rng(self.random_state)
+        n, dim = X.shape
+        self._mu0 = X.mean(axis=0) if self.mu0 is None else np.asarray(self.mu0, dtype=float)
+        self._b0 = self.a0 * X.var(axis=0) / 10 if self.b0 is None else np.asarray(self.b0, dtype=float)
+        self._b0 = np.maximum(self._b0, 1e-12)
+        self._prior = self._predictive(0, np.zeros(dim), np.zeros(dim))
+
+        # start from a partition drawn from the CRP prior
+        labels = crp_table_assignments(n, self.alpha, random_state=rng).astype(np.intp)
+        n_tables = labels.max() + 1
+        self._allocate(max(16, 2 * n_tables), dim)
+        self._free = self._free[:-n_tables]
+        self._counts[:n_tables] = np.bincount(labels)
+        for j in range(dim):
+            self._sums[:n_tables, j] = np.bincount(labels, weights=X[:, j])
+            self._sumsq[:n_tables, j] = np.bincount(labels, weights=X[:, j] ** 2)
+        for k in range(n_tables):
+            self._refresh(k)
+
+        self.n_clusters_trace_ = []
+        for _ in range(self.n_sweeps):
+            with np.errstate(divide='ignore'):
+                self._sweep(X, labels, rng)
+            self._export(labels)
+            self.n_clusters_trace_.append(self.n_clusters_)
+            yield self.n_clusters_
+
+    def _export(self, labels):
+        active = np.flatnonzero(self._counts)
+        relabel = np.zeros(len(self._counts), dtype=np.intp)
+        relabel[active] = np.arange(len(active))
+        self.labels_ = relabel[labels]
+        self.n_clusters_ = len(active)
+        self.counts_ = self._counts[active].astype(np.int64)
+        self.means_ = self._loc[active].copy()
+
+    def fit(self, X):
+        for _ in self.sweeps(X):
+            pass
+        return self
+
+    def predict(self, X):
+        """
+        most probable cluster of every point under the fitted posterior predictive, without opening new clusters
+        """
+        active = np.flatnonzero(self._counts)
+        X = np.asarray(X, dtype=float)
+        log_weight = np.log(self._counts[active]) + self._norm[active] - self._power[active] * np.sum(
+            np.log1p((X[:, np.newaxis, :] - self._loc[active]) ** 2 / self._scale[active]), axis=2)
+        return np.argmax(log_weight, axis=1)
+
+
+class DPMeans:
+    """
+    DP-means (Kulis & Jordan): k-means where a point farther than sqrt(lam) from every center opens a new cluster,
+    minimizing sum of squared distances + lam * number of clusters.
+    the assignment step is vectorized: points are assigned to the existing centers in bulk, then the violators open
+    new clusters one at a time, each new center only being compared with the remaining violators.
+    """
+
+    def __init__(self, lam, max_iter=100, random_state=None):
+        """
+        :param lam: penalty of a new cluster, in squared distance units
+        :param max_iter: maximum number of assignment / update rounds
+        :param random_state: seed or numpy Generator, orders the violators
+        """
+        self.lam = lam
+        self.max_iter = max_iter
+        self.random_state = random_state
+
+    def _assign(self, X, centers, rng):
+        labels, min_dist = assign_clusters(X, centers)
+        centers = list(centers)
+        violators = rng.permutation(np.flatnonzero(min_dist > self.lam))
+        while len(violators):
+            first = violators[0]
+            centers.append(X[first])
+            dist = np.sum((X[violators] - X[first]) ** 2, axis=1)
+            closer = dist < min_dist[violators]
+            labels[violators[closer]] = len(centers) - 1
+            min_dist[violators[closer]] = dist[closer]
+            violators = violators[min_dist[violators] > self.lam]
+        return labels, min_dist, np.asarray(centers)
+
+    def fit(self, X):
+        X = np.asarray(X, dtype=float)
+        rng = np.random.default_rng(self.random_state)
+        centers = X.mean(axis=0, keepdims=True)
+        labels = None
+        n_iter = 0
+        for n_iter in range(1, self.max_iter + 1):
+            new_labels, min_dist, centers = self._assign(X, centers, rng)
+            centers, counts = update_means(X, new_labels, centers)
+            # drop emptied clusters and compact the labels
+            keep = counts > 0
+            relabel = np.cumsum(keep) - 1
+            centers, new_labels = centers[keep], relabel[new_labels]
+            if labels is not None and np.array_equal(labels, new_labels):
+                break
+            labels = new_labels
+
+        self.labels_ = new_labels
+        self.cluster_centers_ = centers
+        self.n_clusters_ = len(centers)
+        self.n_iter_ = n_iter
+        self.objective_ = float(assign_clusters(X, centers)[1].sum() + self.lam * len(centers))
+        return self
+
+    def predict(self, X):
+        return assign_clusters(np.asarray(X, dtype=float), self.cluster_centers_)[0]
@@ -1,20 +1,39 @@
 """
 below code is copied from:
 https://github.com/joelgrus/stupid-itertools-tricks-pydata
+
+the list based helpers (k_meanses, new_means, closest_index ...) are kept as thin wrappers over
+the NumPy engine KMeans, which works on an (n, d) array instead of python lists of tuples.
 """
 
+import multiprocessing as mp
 import random
+import time
 from functools import partial
-from itertools import accumulate
+from itertools import accumulate, islice
+from multiprocessing.pool import ThreadPool
 
-import matplotlib.pyplot as plt
+import numpy as np
+from explorex.cluster.spatial_index import build_index
 from explorex.utils.operator_util import *
-from matplotlib import animation
+from explorex.utils.parallel_scheduler import fix_size_splits
+
+# upper bound of the number of floats held by one block of the (n, k) distance matrix
+_DISTANCE_BLOCK_SIZE = 2 ** 22
 
+# from this number of clusters on, index='auto' assigns points through a spatial index over the centers. at d <= 8,
+# where build_index picks the kd-tree, the tree beats blocked brute force from k=512 on even for unclustered points
+# (0.45s vs 0.57s for 200k points at d=8), while at k=256 it can lose (0.33s vs 0.25s), see benchmarks/spatial_index.py
+INDEX_MIN_CLUSTERS = 512
 
-def k_meanses(points, k):
-    initial_means = random.sample(points, k)
-    return iterate(partial(new_means, points),
+
+def k_meanses(points, k, init=None, random_state=None):
+    X = np.asarray(points, dtype=float)
+    if init is None:
+        initial_means = X[random.sample(range(len(X)), k)].tolist()
+    else:
+        initial_means = KMeans(k, init=init)._init_centers(X, np.random.default_rng(random_state)).tolist()
+    return iterate(partial(new_means, X),
                    initial_means)
 
 
@@ -30,56 +49,755 @@ def until_convergence(it):
 
 
 def new_means(points, old_means):
-    k = len(old_means)
-    assignments = [closest_index(point, old_means)
-                   for point in points]
-    clusters = [[point
-                 for point, c in zip(points, assignments)
-                 if c == j] for j in range(k)]
-    return [cluster_mean(cluster) for cluster in clusters]
+    X = np.asarray(points, dtype=float)
+    means = np.asarray(old_means, dtype=float)
+    labels, _ = assign_clusters(X, means)
+    return update_means(X, labels, means)[0].tolist()
 
 
 def closest_index(point, means):
-    return min(enumerate(means),
-               key=lambda pair: squared_distance(point, pair[1]))[0]
+    diff = np.asarray(means, dtype=float) - np.asarray(point, dtype=float)
+    return int(np.argmin(np.einsum('ij,ij->i', diff, diff)))
 
 
 def squared_distance(p, q):
-    return sum((p_i - q_i) ** 2 for p_i, q_i in zip(p, q))
+    diff = np.asarray(p, dtype=float) - np.asarray(q, dtype=float)
+    return float(diff.dot(diff))
 
 
 def cluster_mean(points):
-    num_points = len(points)
-    dim = len(points[0]) if points else 0
-    sum_points = [sum(point[j] for point in points)
-                  for j in range(dim)]
-    return [s / num_points for s in sum_points]
+    if len(points) == 0:
+        return []
+    return np.mean(np.asarray(points, dtype=float), axis=0).tolist()
+
+
+def row_norms(X):
+    """
+    squared euclidean norm of every row of X
+    """
+    return np.einsum('ij,ij->i', X, X)
+
+
+def pairwise_squared_distances(X, centers, x_norms=None):
+    """
+    the (n, k) matrix of squared distances computed as |x|^2 - 2x.c + |c|^2, so the heavy part is one matrix product
+    :param X: (n, d) array
+    :param centers: (k, d) array
+    :param x_norms: precomputed row_norms(X), optional
+    :return: (n, k) array
+    """
+    if x_norms is None:
+        x_norms = row_norms(X)
+    dist = X.dot(centers.T)
+    dist *= -2
+    dist += x_norms[:, np.newaxis]
+    dist += row_norms(centers)[np.newaxis, :]
+    # rounding may produce tiny negative values
+    np.maximum(dist, 0, out=dist)
+    return dist
+
+
+def assign_clusters(X, centers, x_norms=None, chunk_size=None):
+    """
+    assign every point to its closest center, the distance matrix is built block by block so memory stays bounded
+    :param X: (n, d) array
+    :param centers: (k, d) array
+    :param x_norms: precomputed row_norms(X), optional
+    :param chunk_size: rows per block, derived from the number of centers if not set
+    :return: (labels, squared distances to the assigned centers)
+    """
+    n, k = len(X), len(centers)
+    if x_norms is None:
+        x_norms = row_norms(X)
+    chunk_size = chunk_size or max(1, _DISTANCE_BLOCK_SIZE // max(k, 1))
+
+    labels = np.empty(n, dtype=np.intp)
+    min_dist = np.empty(n, dtype=float)
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        dist = pairwise_squared_distances(X[start:stop], centers, x_norms[start:stop])
+        labels[start:stop] = np.argmin(dist, axis=1)
+        min_dist[start:stop] = dist[np.arange(stop - start), labels[start:stop]]
+    return labels, min_dist
+
+
+def update_means(X, labels, old_means):
+    """
+    recompute the means from the assignments with bincount, empty clusters keep their old mean
+    :param X: (n, d) array
+    :param labels: cluster index of every row
+    :param old_means: (k, d) array
+    :return: (means, counts)
+    """
+    k, dim = old_means.shape
+    counts = np.bincount(labels, minlength=k)
+    sums = np.empty((k, dim), dtype=float)
+    for j in range(dim):
+        sums[:, j] = np.bincount(labels, weights=X[:, j], minlength=k)
+
+    means = old_means.astype(float, copy=True)
+    non_empty = counts > 0
+    means[non_empty] = sums[non_empty] / counts[non_empty, np.newaxis]
+    return means, counts
+
+
+def paired_distances(A, B):
+    """
+    euclidean distance between every row of A and the same row of B
+    """
+    diff = A - B
+    return np.sqrt(np.einsum('ij,ij->i', diff, diff))
+
+
+def center_separation(centers):
+    """
+    distance from every center to its nearest other center
+    """
+    dist = pairwise_squared_distances(centers, centers)
+    np.fill_diagonal(dist, np.inf)
+    return np.sqrt(dist.min(axis=1))
+
+
+def second_max_shift(shift, labels):
+    """
+    the largest shift of any center except the one a point is assigned to, which bounds how much closer any other
+    center can have moved
+    """
+    if len(shift) < 2:
+        return np.zeros(len(labels))
+    second, first = np.argsort(shift)[-2:]
+    return np.where(labels == first, shift[second], shift[first])
+
+
+def two_closest(X, centers, x_norms=None, chunk_size=None):
+    """
+    :return: (labels, distance to the closest center, distance to the second closest center)
+    """
+    n, k = len(X), len(centers)
+    if x_norms is None:
+        x_norms = row_norms(X)
+    chunk_size = chunk_size or max(1, _DISTANCE_BLOCK_SIZE // max(k, 1))
+
+    labels = np.empty(n, dtype=np.intp)
+    first = np.empty(n, dtype=float)
+    second = np.full(n, np.inf)
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        rows = np.arange(stop - start)
+        dist = pairwise_squared_distances(X[start:stop], centers, x_norms[start:stop])
+        labels[start:stop] = np.argmin(dist, axis=1)
+        first[start:stop] = dist[rows, labels[start:stop]]
+        if k > 1:
+            dist[rows, labels[start:stop]] = np.inf
+            second[start:stop] = dist.min(axis=1)
+    return labels, np.sqrt(first), np.sqrt(second)
+
+
+def kmeans_plusplus(X, n_clusters, rng, x_norms=None, sample_weight=None, n_local_trials=None):
+    """
+    k-means++ seeding: every next center is drawn with probability proportional to its (weighted) squared distance
+    to the closest center chosen so far, the best of n_local_trials candidates is kept (greedy k-means++)
+    :param X: (n, d) array
+    :param n_clusters: number of centers
+    :param rng: numpy Generator
+    :param x_norms: precomputed row_norms(X), optional
+    :param sample_weight: weight of every row, optional
+    :param n_local_trials: candidates tried per center, 2 + log(k) if not set
+    :return: (k, d) array
+    """
+    n = len(X)
+    if x_norms is None:
+        x_norms = row_norms(X)
+    weight = np.ones(n) if sample_weight is None else np.asarray(sample_weight, dtype=float)
+    n_local_trials = n_local_trials or 2 + int(np.log(n_clusters))
+
+    centers = np.empty((n_clusters, X.shape[1]), dtype=float)
+    first = rng.choice(n, p=weight / weight.sum())
+    centers[0] = X[first]
+    closest = pairwise_squared_distances(X, centers[:1], x_norms)[:, 0]
+    potential = np.dot(weight, closest)
+
+    for c in range(1, n_clusters):
+        if potential <= 0:
+            # fewer distinct points than clusters, fill up with uniformly drawn rows
+            centers[c:] = X[rng.choice(n, n_clusters - c)]
+            break
+        cumulative = np.cumsum(weight * closest)
+        candidates = np.searchsorted(cumulative, rng.random(n_local_trials) * cumulative[-1])
+        np.minimum(candidates, n - 1, out=candidates)
+        candidate_dist = pairwise_squared_distances(X, X[candidates], x_norms)
+        np.minimum(candidate_dist, closest[:, np.newaxis], out=candidate_dist)
+        candidate_potential = weight.dot(candidate_dist)
+        best = np.argmin(candidate_potential)
+        centers[c] = X[candidates[best]]
+        closest = candidate_dist[:, best]
+        potential = candidate_potential[best]
+    return centers
+
+
+def _refresh_min_dist(args):
+    """
+    lower the distance to the closest candidate of every row of one chunk with the newly drawn candidates
+    """
+    X, x_norms, min_dist, new_candidates = args
+    if len(X):
+        dist = pairwise_squared_distances(X, new_candidates, x_norms).min(axis=1)
+        np.minimum(min_dist, dist, out=min_dist)
+
+
+def _draw_candidates(args):
+    """
+    draw every row of one chunk independently with probability oversampling * d^2 / potential
+    """
+    min_dist, oversampling, potential, seed = args
+    prob = oversampling * min_dist / potential
+    return np.flatnonzero(np.random.default_rng(seed).random(len(min_dist)) < prob)
+
+
+def kmeans_parallel(X, n_clusters, rng, x_norms=None, oversampling=None, n_rounds=5, n_jobs=None,
+                    chunk_size=100000):
+    """
+    scalable k-means|| seeding (Bahmani et al.): every round draws about `oversampling` candidates, then the
+    candidates weighted by the number of points closest to them are reduced to k centers with k-means++.
+    rounds run over fixed size chunks (parallel_scheduler.fix_size_splits) in a thread pool, the chunks are views and
+    numpy releases the GIL in the distance products, so nothing is copied.
+    every chunk draws from its own stream, so the result only depends on the seed and not on the number of threads.
+    :param X: (n, d) array
+    :param n_clusters: number of centers
+    :param rng: numpy Generator
+    :param x_norms: precomputed row_norms(X), optional
+    :param oversampling: expected candidates per round, 2k if not set
+    :param n_rounds: number of sampling rounds
+    :param n_jobs: number of threads, cpu count if not set
+    :param chunk_size: rows per chunk
+    :return: (k, d) array
+    """
+    n = len(X)
+    if x_norms is None:
+        x_norms = row_norms(X)
+    oversampling = oversampling or 2 * n_clusters
+
+    min_dist = np.full(n, np.inf)
+    starts = np.cumsum([0] + [len(c) for c in fix_size_splits(np.arange(n), chunk_size)])
+    chunks = [(X[a:b], x_norms[a:b], min_dist[a:b]) for a, b in zip(starts[:-1], starts[1:]) if b > a]
+    offsets = [a for a, b in zip(starts[:-1], starts[1:]) if b > a]
+
+    candidates = [rng.integers(n)]
+    new_candidates = X[candidates]
+    with ThreadPool(n_jobs or mp.cpu_count()) as pool:
+        for _ in range(n_rounds):
+            pool.map(_refresh_min_dist, [chunk + (new_candidates,) for chunk in chunks])
+            potential = min_dist.sum()
+            if potential <= 0:
+                break
+            seeds = rng.integers(2 ** 63, size=len(chunks))
+            drawn = pool.map(_draw_candidates, [(chunk[2], oversampling, potential, seed)
+                                                for chunk, seed in zip(chunks, seeds)])
+            drawn = np.concatenate([idx + offset for idx, offset in zip(drawn, offsets)])
+            candidates.extend(drawn)
+            new_candidates = X[drawn]
+
+    candidates = np.unique(candidates)
+    if len(candidates) <= n_clusters:
+        rest = np.setdiff1d(np.arange(n), candidates)
+        extra = rng.choice(rest, n_clusters - len(candidates), replace=False)
+        return X[np.concatenate([candidates, extra])]
+
+    labels, _ = assign_clusters(X, X[candidates], x_norms)
+    weight = np.bincount(labels, minlength=len(candidates))
+    return kmeans_plusplus(X[candidates], n_clusters, rng, sample_weight=weight)
+
+
+init_strategy_map = {
+    'random': lambda X, k, rng, x_norms: X[rng.choice(len(X), k, replace=False)],
+    'k-means++': kmeans_plusplus,
+    'k-means||': kmeans_parallel
+}
+
+
+class FitTrace:
+    """
+    assignments and centers of every k-means iteration, kept as int32 labels and float centers so animations and
+    diagnostics can replay a fit without recomputing any distance.
+    e.g.:
+    km = KMeans(5, trace=True).fit(points)
+    for labels, centers in km.trace_:
+        ...
+    """
+
+    def __init__(self):
+        self.labels = []
+        self.centers = []
+
+    def append(self, labels, centers):
+        self.labels.append(np.asarray(labels, dtype=np.int32))
+        self.centers.append(np.array(centers, dtype=float))
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, i):
+        return self.labels[i], self.centers[i]
+
+    def __iter__(self):
+        return zip(self.labels, self.centers)
+
+    def cluster_sizes(self):
+        """
+        :return: (n_iter, k) number of points per cluster at every iteration
+        """
+        k = len(self.centers[0])
+        return np.array([np.bincount(labels, minlength=k) for labels in self.labels])
+
+    def n_changed(self):
+        """
+        :return: number of points changing cluster between consecutive iterations
+        """
+        return np.array([np.count_nonzero(prev != curr) for prev, curr in zip(self.labels, self.labels[1:])])
+
+    def center_shifts(self):
+        """
+        :return: (n_iter - 1, k) distance every center moved between consecutive iterations
+        """
+        return np.array([paired_distances(curr, prev) for prev, curr in zip(self.centers, self.centers[1:])])
+
+
+class KMeans:
+    """
+    NumPy backed Lloyd k-means working on an (n, d) array.
+    e.g.:
+    km = KMeans(5, init='k-means++', random_state=0).fit(points)
+    km.cluster_centers_, km.labels_, km.inertia_
+    km.predict(new_points)
+    """
+
+    def __init__(self, n_clusters=8, init='random', algorithm='lloyd', max_iter=300, tol=1e-4, n_init=1, n_jobs=None,
+                 index='auto', trace=False, random_state=None, chunk_size=None):
+        """
+        :param n_clusters: number of clusters k
+        :param init: 'random', 'k-means++', 'k-means||' or a (k, d) array of initial means
+        :param algorithm: 'lloyd', or the triangle inequality pruned 'elkan' and 'hamerly' which skip most distance
+        computations once points stop moving, the skipped share of the n * k distances of every iteration is
+        reported in pruning_ratios_
+        :param max_iter: maximum number of Lloyd iterations
+        :param tol: convergence threshold on the total squared center shift, relative to the mean feature variance
+        :param n_init: number of restarts from different seeds, the run with the lowest inertia is kept and the stats
+        of every run are reported in n_init_stats_
+        :param n_jobs: processes running the restarts, cpu count if not set
+        :param index: spatial index used to find the closest center in lloyd iterations and predict, one of
+        spatial_index.index_map, or 'auto' which uses build_index from INDEX_MIN_CLUSTERS clusters on and brute force
+        below
+        :param trace: record the assignments and centers of every iteration in trace_, see FitTrace
+        :param random_state: seed, or numpy Generator, used to pick the initial means
+        :param chunk_size: rows per block of the distance matrix, derived from k if not set
+        """
+        self.n_clusters = n_clusters
+        self.init = init
+        self.algorithm = algorithm
+        self.max_iter = max_iter
+        self.tol = tol
+        self.n_init = n_init
+        self.n_jobs = n_jobs
+        self.index = index
+        self.trace = trace
+        self.random_state = random_state
+        self.chunk_size = chunk_size
+
+    def _check_data(self, X):
+        X = np.asarray(X, dtype=float)
+        if X.ndim != 2:
+            raise ValueError("expected an (n, d) array, got shape {}".format(X.shape))
+        return X
+
+    def _init_centers(self, X, rng, x_norms=None):
+        if len(X) < self.n_clusters:
+            raise ValueError("n_samples={} should be >= n_clusters={}".format(len(X), self.n_clusters))
+        if not isinstance(self.init, str):
+            return np.array(self.init, dtype=float)
+        if self.init not in init_strategy_map:
+            raise ValueError("init should be one of {}, got {}".format(list(init_strategy_map), self.init))
+        if x_norms is None:
+            x_norms = row_norms(X)
+        return init_strategy_map[self.init](X, self.n_clusters, rng, x_norms)
+
+    def _index_kind(self):
+        if self.index == 'auto':
+            return 'auto' if self.n_clusters >= INDEX_MIN_CLUSTERS else 'brute'
+        return self.index or 'brute'
+
+    def _assign(self, X, means, x_norms=None):
+        kind = self._index_kind()
+        if kind == 'brute':
+            return assign_clusters(X, means, x_norms, self.chunk_size)
+        distances, labels = build_index(means, kind).query(X)
+        return labels, distances ** 2
+
+    def iter_means(self, X, means):
+        """
+        return (means, step(means), step(step(means)), ...) like operator_util.iterate, each step is one Lloyd update
+        """
+        X = self._check_data(X)
+        x_norms = row_norms(X)
+        means = np.asarray(means, dtype=float)
+        while True:
+            yield means
+            labels, _ = self._assign(X, means, x_norms)
+            means, _ = update_means(X, labels, means)
+
+    def fit(self, X):
+        X = self._check_data(X)
+        if self.algorithm not in algorithm_map:
+            raise ValueError("algorithm should be one of {}, got {}".format(list(algorithm_map), self.algorithm))
+        if self.n_init > 1:
+            return self._fit_restarts(X)
+
+        rng = np.random.default_rng(self.random_state)
+        tol = self.tol * np.mean(np.var(X, axis=0))
+        x_norms = row_norms(X)
+
+        self.trace_ = FitTrace() if self.trace else None
+        means = self._init_centers(X, rng, x_norms)
+        means, n_iter, pruning_ratios = algorithm_map[self.algorithm](self, X, means, x_norms, tol)
+
+        # make labels_ consistent with the final centers
+        self.labels_, min_dist = self._assign(X, means, x_norms)
+        if self.trace_ is not None and not np.array_equal(self.trace_.centers[-1], means):
+            self._record(self.labels_, means)
+        self.cluster_centers_ = means
+        self.index_ = None
+        self.inertia_ = float(min_dist.sum())
+        self.n_iter_ = n_iter
+        self.pruning_ratios_ = pruning_ratios
+        return self
+
+    def _fit_restarts(self, X):
+        """
+        run n_init single fits in a process pool, the points are copied once into shared memory and every worker maps
+        them read-only instead of receiving a pickled copy per task. without multiprocessing.shared_memory (python <
+        3.8) the tasks get the pickled points
+        """
+        seeds = np.random.default_rng(self.random_state).integers(2 ** 63, size=self.n_init)
+        params = {'n_clusters': self.n_clusters, 'init': self.init, 'algorithm': self.algorithm,
+                  'max_iter': self.max_iter, 'tol': self.tol, 'index': self.index, 'trace': self.trace,
+                  'chunk_size': self.chunk_size}
+        n_jobs = min(self.n_init, self.n_jobs or mp.cpu_count())
+
+        try:
+            from multiprocessing import shared_memory
+        except ImportError:
+            shared_memory = None
+
+        if n_jobs == 1:
+            runs = [_run_restart(params, seed, X) for seed in seeds]
+        elif shared_memory is None:
+            with mp.Pool(n_jobs) as pool:
+                runs = pool.map(partial(_run_restart, params, X=X), seeds)
+        else:
+            block = shared_memory.SharedMemory(create=True, size=X.nbytes)
+            try:
+                np.ndarray(X.shape, dtype=X.dtype, buffer=block.buf)[:] = X
+                with mp.Pool(n_jobs, initializer=_attach_shared_points,
+                             initargs=(block.name, X.shape, X.dtype.str)) as pool:
+                    runs = pool.map(partial(_run_restart, params), seeds)
+            finally:
+                block.close()
+                block.unlink()
+
+        best = min(runs, key=lambda run: run['inertia'])
+        self.labels_, min_dist = self._assign(X, best['cluster_centers'])
+        self.cluster_centers_ = best['cluster_centers']
+        self.index_ = None
+        self.inertia_ = float(min_dist.sum())
+        self.n_iter_ = best['n_iter']
+        self.pruning_ratios_ = best['pruning_ratios']
+        self.trace_ = best['trace']
+        self.n_init_stats_ = [{key: run[key] for key in ['seed', 'inertia', 'n_iter', 'converged', 'seconds']}
+                              for run in runs]
+        return self
+
+    def _record(self, labels, means):
+        if getattr(self, 'trace_', None) is not None:
+            self.trace_.append(labels, means)
+
+    def _fit_lloyd(self, X, means, x_norms, tol):
+        labels = None
+        n_iter = 0
+        for n_iter in range(1, self.max_iter + 1):
+            new_labels, _ = self._assign(X, means, x_norms)
+            self._record(new_labels, means)
+            new_means, _ = update_means(X, new_labels, means)
+            shift = np.sum((new_means - means) ** 2)
+            means = new_means
+            if labels is not None and np.array_equal(labels, new_labels):
+                break
+            labels = new_labels
+            if shift <= tol:
+                break
+        return means, n_iter, [0.0] * n_iter
+
+    def _fit_hamerly(self, X, means, x_norms, tol):
+        """
+        Hamerly's k-means: one upper bound (distance to the assigned center) and one lower bound (distance to the
+        second closest center) per point, a point is only revisited when its upper bound exceeds
+        max(lower bound, half the distance from its center to the nearest other center).
+        """
+        n, k = len(X), len(means)
+        labels, upper, lower = two_closest(X, means, x_norms, self.chunk_size)
+        self._record(labels, means)
+        pruning_ratios = [0.0]
+        n_iter = 1
+        while True:
+            new_means, _ = update_means(X, labels, means)
+            shift = paired_distances(new_means, means)
+            means = new_means
+            if n_iter >= self.max_iter or np.sum(shift ** 2) <= tol:
+                break
+            n_iter += 1
+
+            upper += shift[labels]
+            lower -= second_max_shift(shift, labels)
+
+            bound = np.maximum(0.5 * center_separation(means)[labels], lower)
+            todo = np.flatnonzero(upper > bound)
+            upper[todo] = paired_distances(X[todo], means[labels[todo]])
+            computed = len(todo)
+
+            todo = todo[upper[todo] > bound[todo]]
+            labels[todo], upper[todo], lower[todo] = two_closest(X[todo], means, x_norms[todo], self.chunk_size)
+            computed += len(todo) * k
+            self._record(labels, means)
+            pruning_ratios.append(1 - computed / (n * k))
+        return means, n_iter, pruning_ratios
+
+    def _fit_elkan(self, X, means, x_norms, tol):
+        """
+        Elkan's k-means: an upper bound per point and a lower bound per (point, center), a distance is only computed
+        when the upper bound exceeds both the lower bound and half the distance between the two centers.
+        the (n, k) lower bounds cost n * k floats, prefer hamerly when that does not fit in memory.
+        """
+        n, k = len(X), len(means)
+        chunk_size = self.chunk_size or max(1, _DISTANCE_BLOCK_SIZE // max(k, 1))
+        lower = np.empty((n, k), dtype=float)
+        for start in range(0, n, chunk_size):
+            stop = min(start + chunk_size, n)
+            lower[start:stop] = np.sqrt(pairwise_squared_distances(X[start:stop], means, x_norms[start:stop]))
+        labels = np.argmin(lower, axis=1)
+        upper = lower[np.arange(n), labels]
+        self._record(labels, means)
+        pruning_ratios = [0.0]
+        n_iter = 1
+        while True:
+            new_means, _ = update_means(X, labels, means)
+            shift = paired_distances(new_means, means)
+            means = new_means
+            if n_iter >= self.max_iter or np.sum(shift ** 2) <= tol:
+                break
+            n_iter += 1
+
+            upper += shift[labels]
+            lower -= shift[np.newaxis, :]
+            np.maximum(lower, 0, out=lower)
+
+            half_cc = 0.5 * np.sqrt(pairwise_squared_distances(means, means))
+            np.fill_diagonal(half_cc, np.inf)
+            todo = np.flatnonzero(upper > half_cc.min(axis=1)[labels])
+            upper[todo] = paired_distances(X[todo], means[labels[todo]])
+            lower[todo, labels[todo]] = upper[todo]
+            computed = len(todo)
+
+            for start in range(0, len(todo), chunk_size):
+                block = todo[start:start + chunk_size]
+                a, u = labels[block], upper[block]
+                # centers that may be closer than the assigned one, the assigned one itself has an inf half distance
+                mask = (u[:, np.newaxis] > lower[block]) & (u[:, np.newaxis] > half_cc[a])
+                rows, cols = np.nonzero(mask)
+                dist = paired_distances(X[block[rows]], means[cols])
+                lower[block[rows], cols] = dist
+                computed += len(rows)
+
+                candidate = np.full((len(block), k), np.inf)
+                candidate[rows, cols] = dist
+                candidate[np.arange(len(block)), a] = u
+                labels[block] = np.argmin(candidate, axis=1)
+                upper[block] = candidate[np.arange(len(block)), labels[block]]
+            self._record(labels, means)
+            pruning_ratios.append(1 - computed / (n * k))
+        return means, n_iter, pruning_ratios
+
+    def query(self, X):
+        """
+        batched nearest center lookup, used to label new data against the fitted centers in bulk.
+        the index over cluster_centers_ is built on first use and kept in index_
+        :param X: (n, d) array-like
+        :return: (distances, labels)
+        """
+        if getattr(self, 'index_', None) is None:
+            self.index_ = build_index(self.cluster_centers_, self._index_kind())
+        return self.index_.query(self._check_data(X))
+
+    def predict(self, X):
+        return self.query(X)[1]
+
+    def fit_predict(self, X):
+        return self.fit(X).labels_
+
+
+algorithm_map = {
+    'lloyd': KMeans._fit_lloyd,
+    'elkan': KMeans._fit_elkan,
+    'hamerly': KMeans._fit_hamerly
+}
+
+# the points of KMeans restarts, mapped by every pool worker from shared memory
+_shared_points = None
+_shared_block = None
+
+
+def _attach_shared_points(name, shape, dtype):
+    global _shared_points, _shared_block
+    from multiprocessing import shared_memory
+    _shared_block = shared_memory.SharedMemory(name=name)
+    _shared_points = np.ndarray(shape, dtype=dtype, buffer=_shared_block.buf)
+    _shared_points.flags.writeable = False
+
+
+def _run_restart(params, seed, X=None):
+    start = time.time()
+    km = KMeans(random_state=seed, **params).fit(_shared_points if X is None else X)
+    return {'seed': int(seed),
+            'cluster_centers': km.cluster_centers_,
+            'inertia': km.inertia_,
+            'n_iter': km.n_iter_,
+            'converged': km.n_iter_ < km.max_iter,
+            'pruning_ratios': km.pruning_ratios_,
+            'trace': km.trace_,
+            'seconds': time.time() - start}
+
+
+def iter_batches(points, batch_size=1000):
+    """
+    group any iterable of single points into (batch_size, d) arrays, only one batch is held in memory
+    :param points: iterable or generator of points
+    :param batch_size: rows per batch
+    :return: generator of arrays
+    """
+    it = iter(points)
+    while True:
+        batch = list(islice(it, batch_size))
+        if not batch:
+            return
+        yield np.asarray(batch, dtype=float)
+
+
+class MiniBatchKMeans(KMeans):
+    """
+    streaming k-means fed with batches of points, memory is bounded by the batch size rather than the dataset size.
+    every center moves towards the mean of its batch members with its own learning rate 1 / (points seen by it),
+    e.g.:
+    km = MiniBatchKMeans(5, random_state=0)
+    for page in pages:
+        km.partial_fit(page)
+    or
+    km = MiniBatchKMeans(5).fit(iter_batches(point_generator, 1000))
+    """
+
+    def __init__(self, n_clusters=8, init='random', index='auto', random_state=None, chunk_size=None):
+        super().__init__(n_clusters=n_clusters, init=init, index=index, random_state=random_state,
+                         chunk_size=chunk_size)
+        self._rng = None
+        self._pending = []
+
+    def _init_from_pending(self):
+        # the first batches may be smaller than k, they are kept until there are enough points to seed from
+        X = np.concatenate(self._pending)
+        if len(X) < self.n_clusters:
+            return None
+        self._pending = []
+        self.cluster_centers_ = self._init_centers(X, self._rng)
+        self.counts_ = np.zeros(self.n_clusters, dtype=np.int64)
+        self.inertia_ = 0.0
+        self.n_samples_seen_ = 0
+        self.n_steps_ = 0
+        return X
+
+    def partial_fit(self, batch):
+        """
+        update the centers with one batch of points
+        :param batch: (m, d) array-like
+        :return: self
+        """
+        X = self._check_data(batch)
+        if len(X) == 0:
+            return self
+        if self._rng is None:
+            self._rng = np.random.default_rng(self.random_state)
+        if not hasattr(self, 'cluster_centers_'):
+            self._pending.append(X)
+            X = self._init_from_pending()
+            if X is None:
+                return self
+
+        labels, min_dist = self._assign(X, self.cluster_centers_)
+        batch_means, batch_counts = update_means(X, labels, self.cluster_centers_)
+
+        self.counts_ += batch_counts
+        hit = batch_counts > 0
+        rate = batch_counts[hit] / self.counts_[hit]
+        centers = self.cluster_centers_
+        centers[hit] += (batch_means[hit] - centers[hit]) * rate[:, np.newaxis]
+        self.index_ = None
+
+        # inertia_ is the streaming inertia: every point measured against the centers current at its batch
+        self.inertia_ += float(min_dist.sum())
+        self.n_samples_seen_ += len(X)
+        self.n_steps_ += 1
+        return self
+
+    def fit(self, batches):
+        """
+        :param batches: iterable or generator of (m, d) batches, consumed once
+        :return: self
+        """
+        for batch in batches:
+            self.partial_fit(batch)
+        if self._pending:
+            raise ValueError("n_samples={} should be >= n_clusters={}".format(
+                sum(len(b) for b in self._pending), self.n_clusters))
+        return self
+
+    def fit_predict(self, X):
+        X = self._check_data(X)
+        return self.fit([X]).predict(X)
+
 
+def run_kmeans_animation(seed=0, k=5, data=None, output_filename=None, writer='imagemagick', fps=4):
+    """
+    replay a traced fit frame by frame, every frame is drawn from the recorded labels and centers and handed to the
+    writer right away, so neither distances are recomputed nor frames held in memory
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib import animation
 
-def run_kmeans_animation(seed=0, k=5, data=None, output_filename=None):
     output_filename = output_filename or 'kmeans2.gif'
     random.seed(seed)
     data = data or [(random.choice([0, 1, 2, 4, 5]) + random.random(),
                      random.normalvariate(0, 1)) for _ in range(500)]
-    meanses = [mean for mean in until_convergence(k_meanses(data, k))]
+    X = np.asarray(data, dtype=float)
+    initial_means = X[random.sample(range(len(X)), k)]
+    trace = KMeans(k, init=initial_means, tol=0, trace=True).fit(X).trace_
 
     # colors = random.sample(list(matplotlib.colors.cnames), k)
-    colors = ['r', 'g', 'b', 'c', 'm']
-
-    def animation_frame(nframe):
-        means = meanses[nframe]
-        plt.cla()
-        assignments = [closest_index(point, means)
-                       for point in data]
-        clusters = [[point
-                     for point, c in zip(data, assignments)
-                     if c == j] for j in range(k)]
-
-        for cluster, color, mean in zip(clusters, colors, means):
-            x, y = zip(*cluster)
-            plt.scatter(x, y, color=color)
-            plt.plot(*mean, color=color, marker='*', markersize=20)
+    colors = np.array(['r', 'g', 'b', 'c', 'm'])
+    colors = colors[np.arange(k) % len(colors)]
 
     fig = plt.figure(figsize=(5, 4))
-    anim = animation.FuncAnimation(fig, animation_frame, frames=len(meanses))
-    anim.save(output_filename, writer='imagemagick', fps=4)
+    points = plt.scatter(X[:, 0], X[:, 1])
+    means = plt.scatter(trace.centers[0][:, 0], trace.centers[0][:, 1], c=colors, marker='*', s=400,
+                        edgecolors='k')
+    movie_writer = animation.writers[writer](fps=fps)
+    with movie_writer.saving(fig, output_filename, dpi=fig.dpi):
+        for labels, centers in trace:
+            points.set_color(colors[labels])
+            means.set_offsets(centers[:, :2])
+            movie_writer.grab_frame()
+    plt.close(fig)
@@ -3,22 +3,31 @@ original reference:
 https://github.com/echen original reference is in Ruby
 """
 
-from random import randint, random
+from random import getrandbits, randint, random
 
 import numpy as np
-from scipy.stats import beta
 
+from explorex.utils.basic_util import lazy_import
 
-def chinese_restaurant_process(num_customers, alpha):
+stats = lazy_import('scipy.stats')
+
+
+def chinese_restaurant_process(num_customers, alpha, random_state=None):
     if num_customers <= 0:
         return []
 
+    # the global random module state is used unless a seed or numpy Generator is given
+    rand, pick = random, randint
+    if random_state is not None:
+        rng = np.random.default_rng(random_state)
+        rand, pick = rng.random, lambda low, high: int(rng.integers(low, high + 1))
+
     table_assignments = [1]  # first customer sits at table 1
     next_open_table = 2  # index of the next empty table
 
     # Now generate table assignments for the rest of the customers.
     for i in range(1, num_customers + 1):
-        if random() < alpha / (alpha + i):
+        if rand() < alpha / (alpha + i):
             # Customer sits at new table.
             table_assignments.append(next_open_table)
             next_open_table += 1
@@ -26,41 +35,232 @@ def chinese_restaurant_process(num_customers, alpha):
             # Customer sits at an existing table.
             # He chooses which table to sit at by giving equal weight to each
             # customer already sitting at a table.
-            which_table = table_assignments[randint(0, len(table_assignments) - 1)]
+            which_table = table_assignments[pick(0, len(table_assignments) - 1)]
             table_assignments.append(which_table)
 
     return table_assignments
 
 
-def polya_urn_model(base_color_distribution, num_balls, alpha):
+# replicates x customers drawn at once by crp_table_assignments
+_CRP_BLOCK_SIZE = 2 ** 20
+
+
+def _resolve_pointers(parent):
+    """
+    pointer jumping: every entry points to an earlier one or to itself (a root), after log(depth) rounds of
+    parent = parent[parent] every entry points to its root
+    """
+    while True:
+        grand_parent = parent[parent]
+        if np.array_equal(grand_parent, parent):
+            return parent
+        parent = grand_parent
+
+
+def crp_table_assignments(num_customers, alpha, num_replicates=None, random_state=None, block_size=_CRP_BLOCK_SIZE):
+    """
+    vectorized chinese restaurant process.
+    customer i opens a new table with probability alpha / (alpha + i), which does not depend on the seating so far,
+    otherwise he joins the table of a uniformly chosen earlier customer, i.e. a table chosen proportionally to its
+    count. the draws are made for a block of replicates and customers at once: a pick of a customer of an earlier block
+    reads its table from the output, the chains of picks inside the block are resolved by pointer jumping, so no python
+    loop runs over the customers and the temporaries stay within the block whatever the output size.
+    :param num_customers: customers per replicate
+    :param alpha: concentration parameter
+    :param num_replicates: number of independent replicates, a single one if not set
+    :param random_state: seed or numpy Generator
+    :param block_size: replicates x customers drawn at once, about 40 bytes of temporaries each
+    :return: int32 table index of every customer, tables are numbered from 0 in order of opening,
+    (num_customers,) or (num_replicates, num_customers)
+    """
+    rng = np.random.default_rng(random_state)
+    n = max(num_customers, 0)
+    assignments = np.empty((1 if num_replicates is None else num_replicates, n), dtype=np.int32)
+    if assignments.size:
+        rows = max(1, min(len(assignments), block_size // n))
+        cols = max(1, min(n, block_size // rows))
+        for row in range(0, len(assignments), rows):
+            _crp_block(assignments[row:row + rows], alpha, cols, rng)
+    return assignments if num_replicates is not None else assignments[0]
+
+
+def _crp_block(out, alpha, cols, rng):
+    """
+    fill out, (replicates, customers), cols customers at a time
+    """
+    num_tables = np.zeros(len(out), dtype=np.int32)
+    row_index = np.arange(len(out))[:, np.newaxis]
+    for lo in range(0, out.shape[1], cols):
+        hi = min(lo + cols, out.shape[1])
+        seated = np.arange(lo, hi)
+        shape = (len(out), hi - lo)
+        new_table = rng.random(shape) < alpha / (alpha + seated)
+        if lo == 0:
+            new_table[:, 0] = True
+        table_ids = np.cumsum(new_table, axis=1, dtype=np.int32)
+        table_ids += num_tables[:, np.newaxis] - 1
+        num_tables = table_ids[:, -1] + 1
+
+        picked = (rng.random(shape) * seated).astype(np.intp)
+        # roots: the new tables and the picks of an earlier block, whose table is known
+        earlier = picked < lo
+        root = new_table | earlier
+        if lo:
+            table_ids[earlier] = out[np.broadcast_to(row_index, shape)[earlier], picked[earlier]]
+        local = np.arange(hi - lo)
+        parent = np.where(root, local, picked - lo)
+        parent += row_index * (hi - lo)
+        out[:, lo:hi] = table_ids.ravel()[_resolve_pointers(parent.ravel())].reshape(shape)
+
+
+def crp_table_counts(assignments):
+    """
+    :param assignments: output of crp_table_assignments
+    :return: number of customers per table, (num_tables,) or (num_replicates, max num_tables) padded with zeros
+    """
+    assignments = np.asarray(assignments)
+    if assignments.ndim == 1:
+        return np.bincount(assignments)
+    num_tables = assignments.max() + 1 if assignments.size else 0
+    offsets = (np.arange(len(assignments)) * num_tables)[:, np.newaxis]
+    counts = np.bincount((assignments + offsets).ravel(), minlength=len(assignments) * num_tables)
+    return counts.reshape(len(assignments), num_tables)
+
+
+class PolyaUrn:
+    """
+    polya urn that only keeps the distinct colors and how many balls of each are in the urn, so memory grows with the
+    number of colors instead of the number of balls.
+    e.g.:
+    urn = PolyaUrn(unit_uniform, alpha=1, random_state=0)
+    idx = urn.draw(1000000)      # int32 index into urn.colors of every drawn ball
+    urn.colors, urn.counts
+    """
+
+    def __init__(self, base_color_distribution, alpha, random_state=None):
+        self.base_color_distribution = base_color_distribution
+        self.alpha = alpha
+        # without a seed or numpy Generator the stream is seeded from the global random module state, so random.seed
+        # makes the urn reproducible like chinese_restaurant_process
+        self.rng = np.random.default_rng(getrandbits(64) if random_state is None else random_state)
+        self.colors = []
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    @property
+    def num_balls(self):
+        return int(self.counts.sum())
+
+    def draw(self, num_balls):
+        """
+        draw a batch of balls, every drawn ball is put back together with a copy.
+        ball i of the batch gets a new color with probability alpha / (alpha + balls in urn), otherwise it copies a
+        uniformly chosen ball: one already in the urn, looked up through the cumulative counts, or an earlier ball of
+        the batch, resolved by pointer jumping.
+        :param num_balls: number of balls to draw
+        :return: int32 index into self.colors of every drawn ball
+        """
+        if num_balls <= 0:
+            return np.zeros(0, dtype=np.int32)
+        in_urn = self.num_balls
+        seated = np.arange(num_balls)
+        total = in_urn + seated
+
+        new_color = self.rng.random(num_balls) < self.alpha / (self.alpha + total)
+        picked = (self.rng.random(num_balls) * total).astype(np.intp)
+        from_batch = ~new_color & (picked >= in_urn)
+        parent = np.where(from_batch, picked - in_urn, seated)
+        roots = _resolve_pointers(parent)
+
+        color_index = np.empty(num_balls, dtype=np.int32)
+        color_index[new_color] = len(self.colors) + np.arange(np.count_nonzero(new_color))
+        from_urn = ~new_color & ~from_batch
+        color_index[from_urn] = np.searchsorted(np.cumsum(self.counts), picked[from_urn], side='right')
+        color_index = color_index[roots]
+
+        self.colors.extend(self.base_color_distribution() for _ in range(np.count_nonzero(new_color)))
+        counts = np.bincount(color_index, minlength=len(self.colors))
+        counts[:len(self.counts)] += self.counts
+        self.counts = counts
+        return color_index
+
+    def as_list(self, color_index):
+        """
+        :return: list of the colors of the given balls, the same shape polya_urn_model returns
+        """
+        return [self.colors[i] for i in color_index]
+
+
+def polya_urn_model(base_color_distribution, num_balls, alpha, random_state=None):
     if num_balls <= 0:
         return []
 
-    balls_in_urn = []
-    for i in range(1, num_balls + 1):
-        if random() < alpha / (alpha + len(balls_in_urn)):
-            # Draw a new color, put a ball of this color in the urn.
-            new_color = base_color_distribution()
-            balls_in_urn.append(new_color)
-        else:
-            # Draw a ball from the urn, add another ball of the same color.
-            ball = balls_in_urn[randint(0, len(balls_in_urn) - 1)]
-            balls_in_urn.append(ball)
-
-    return balls_in_urn
+    urn = PolyaUrn(base_color_distribution, alpha, random_state)
+    return urn.as_list(urn.draw(num_balls))
 
 
-def stick_breaking(num_weights, alpha):
-    betas = beta.rvs(1, alpha, size=num_weights)
-    remaining_stick_lengths = [1, np.cumprod(1 - betas)][1:num_weights]
+def stick_breaking(num_weights, alpha, random_state=None):
+    if random_state is None:
+        betas = stats.beta.rvs(1, alpha, size=num_weights)
+    else:
+        betas = np.random.default_rng(random_state).beta(1, alpha, size=num_weights)
+    remaining_stick_lengths = np.concatenate([[1], np.cumprod(1 - betas)[:-1]])
     weights = remaining_stick_lengths * betas
     return weights
 
 
+def stick_breaking_weights(num_draws, alpha, truncation=None, tol=None, max_truncation=100000, random_state=None):
+    """
+    many truncated dirichlet process weight vectors in one vectorized pass, row i is
+    w_ij = beta_ij * prod_{l<j}(1 - beta_il) with beta ~ Beta(1, alpha).
+    without a truncation the sticks are broken in growing blocks until the leftover stick mass prod_j(1 - beta_ij) of
+    every draw is below tol.
+    :param num_draws: number of weight vectors
+    :param alpha: concentration parameter
+    :param truncation: number of weights per draw
+    :param tol: leftover stick mass tolerance used to pick the truncation when it is not given
+    :param max_truncation: upper bound of the automatically picked truncation
+    :param random_state: seed or numpy Generator
+    :return: (num_draws, truncation) array, the leftover mass of every row is 1 - row sum
+    """
+    if truncation is None and tol is None:
+        raise ValueError("either truncation or tol should be set")
+    rng = np.random.default_rng(random_state)
+
+    if truncation is not None:
+        betas = rng.beta(1, alpha, size=(num_draws, truncation))
+    else:
+        # the expected leftover after t breaks is (alpha / (1 + alpha)) ** t, start from that guess and double
+        block = int(np.clip(np.ceil(np.log(tol) / np.log(alpha / (1.0 + alpha))), 1, max_truncation))
+        blocks = []
+        leftover = np.ones(num_draws)
+        truncation = 0
+        while True:
+            betas = rng.beta(1, alpha, size=(num_draws, block))
+            blocks.append(betas)
+            truncation += block
+            remaining = leftover[:, np.newaxis] * np.cumprod(1 - betas, axis=1)
+            below = remaining.max(axis=0) < tol
+            if below.any():
+                # cut the last block right after the first break where every draw is below tol
+                truncation -= block - (np.argmax(below) + 1)
+                break
+            leftover = remaining[:, -1]
+            if truncation >= max_truncation:
+                truncation = max_truncation
+                break
+            block = min(2 * block, max_truncation - truncation)
+        betas = np.concatenate(blocks, axis=1)[:, :truncation]
+
+    remaining_stick_lengths = np.ones_like(betas)
+    np.cumprod(1 - betas[:, :-1], axis=1, out=remaining_stick_lengths[:, 1:])
+    return remaining_stick_lengths * betas
+
+
 if __name__ == "__main__":
     # experimental one
     print("===============exp1=================")
     print(chinese_restaurant_process(10, 1))
+    print(crp_table_assignments(10, 1))
     print("====================================")
     print()
 
@@ -68,11 +268,14 @@ if __name__ == "__main__":
     print("===============exp2=================")
     unit_uniform = lambda: random()
     print(polya_urn_model(unit_uniform, num_balls=10, alpha=1))
+    urn = PolyaUrn(unit_uniform, alpha=1)
+    print(urn.draw(10), urn.colors, urn.counts)
     print("====================================")
     print()
 
     # experimental three
     print("===============exp3=================")
     print(stick_breaking(10, 1))
+    print(stick_breaking_weights(3, 1, tol=1e-3).shape)
     print("====================================")
     print()
@@ -0,0 +1,172 @@
+"""
+k-means over data larger than memory: an np.memmap, a .npy file or a directory of .npy chunks.
+every iteration streams the data chunk by chunk, each worker process opens the file itself in read-only mmap mode and
+only ships back the per-center sums and counts of its chunk, which are then reduced into the new centers.
+e.g.:
+km = OutOfCoreKMeans(20, init='k-means++', n_jobs=8).fit('/data/features/')
+for labels in km.iter_labels('/data/features/'):
+    ...
+"""
+
+import glob
+import multiprocessing as mp
+import os
+
+import numpy as np
+
+from explorex.cluster.k_means_ import KMeans, assign_clusters
+
+
+def _file_offset(source):
+    """
+    byte offset of the data of a memmap in its file. a view (e.g. np.load(path, mmap_mode='r')[6000:]) inherits the
+    offset of the memmap it was taken from, its own offset is found from its distance to that root memmap
+    """
+    root = source
+    while isinstance(root.base, np.memmap):
+        root = root.base
+    return root.offset + source.__array_interface__['data'][0] - root.__array_interface__['data'][0]
+
+
+def chunk_specs(source, chunk_rows=100000):
+    """
+    describe how to open every chunk of the source, the specs are small tuples so they are cheap to send to workers
+    :param source: np.memmap (e.g. np.load(path, mmap_mode='r')), path to a .npy file or directory of .npy files
+    :param chunk_rows: maximum rows per chunk
+    :return: list of (open_args, start, stop)
+    """
+    if isinstance(source, np.memmap):
+        if source.ndim != 2 or source.filename is None:
+            raise ValueError("expected a file backed (n, d) memmap")
+        if not (source.flags.c_contiguous or source.flags.f_contiguous):
+            raise ValueError("expected a contiguous memmap, got a strided view, e.g. of a column or a step slice")
+        order = 'F' if source.flags.f_contiguous and not source.flags.c_contiguous else 'C'
+        open_args = ('memmap', source.filename, source.dtype.str, source.shape, _file_offset(source), order)
+        n = source.shape[0]
+        return [(open_args, start, min(start + chunk_rows, n)) for start in range(0, n, chunk_rows)]
+
+    if isinstance(source, str) and os.path.isdir(source):
+        paths = sorted(glob.glob(os.path.join(source, '*.npy')))
+        if not paths:
+            raise ValueError("no .npy chunk found in {}".format(source))
+    elif isinstance(source, str):
+        paths = [source]
+    else:
+        raise TypeError("expected a memmap, a .npy path or a directory of .npy files, got {}".format(type(source)))
+
+    specs = []
+    for path in paths:
+        n = np.load(path, mmap_mode='r').shape[0]
+        specs += [(('npy', path), start, min(start + chunk_rows, n)) for start in range(0, n, chunk_rows)]
+    return specs
+
+
+def open_chunk(spec):
+    open_args, start, stop = spec
+    if open_args[0] == 'memmap':
+        _, filename, dtype, shape, offset, order = open_args
+        data = np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=shape, order=order)
+    else:
+        data = np.load(open_args[1], mmap_mode='r')
+    return np.asarray(data[start:stop], dtype=float)
+
+
+def _chunk_statistics(args):
+    """
+    sufficient statistics of one chunk: per-center sums and counts, and the chunk inertia
+    """
+    spec, centers = args
+    X = open_chunk(spec)
+    k, dim = centers.shape
+    labels, min_dist = assign_clusters(X, centers)
+    sums = np.empty((k, dim), dtype=float)
+    for j in range(dim):
+        sums[:, j] = np.bincount(labels, weights=X[:, j], minlength=k)
+    return sums, np.bincount(labels, minlength=k), float(min_dist.sum())
+
+
+def _chunk_labels(args):
+    spec, centers = args
+    return assign_clusters(open_chunk(spec), centers)[0].astype(np.int32)
+
+
+class OutOfCoreKMeans(KMeans):
+    """
+    Lloyd k-means whose iterations are map (chunk statistics) / reduce (sum) passes over chunked on-disk data.
+    the initial centers are drawn with the KMeans init strategy from a random sample of init_size rows.
+    """
+
+    def __init__(self, n_clusters=8, init='k-means++', max_iter=300, tol=1e-4, n_jobs=None, chunk_rows=100000,
+                 init_size=None, random_state=None):
+        """
+        :param n_jobs: worker processes, cpu count if not set
+        :param chunk_rows: maximum rows per chunk, which bounds the memory of every worker
+        :param init_size: rows sampled to seed the centers, max(10000, 20k) if not set
+        """
+        super().__init__(n_clusters=n_clusters, init=init, max_iter=max_iter, tol=tol, n_jobs=n_jobs,
+                         random_state=random_state)
+        self.chunk_rows = chunk_rows
+        self.init_size = init_size
+
+    def _sample_rows(self, specs, rng):
+        sizes = np.array([stop - start for _, start, stop in specs])
+        n = sizes.sum()
+        size = min(n, self.init_size or max(10000, 20 * self.n_clusters))
+        rows = np.sort(rng.choice(n, size, replace=False))
+        bounds = np.concatenate([[0], np.cumsum(sizes)])
+        sample = []
+        for i, spec in enumerate(specs):
+            picked = rows[(rows >= bounds[i]) & (rows < bounds[i + 1])] - bounds[i]
+            if len(picked):
+                sample.append(open_chunk(spec)[picked])
+        return np.concatenate(sample)
+
+    def fit(self, source):
+        specs = chunk_specs(source, self.chunk_rows)
+        rng = np.random.default_rng(self.random_state)
+        sample = self._sample_rows(specs, rng)
+        tol = self.tol * np.mean(np.var(sample, axis=0))
+        means = self._init_centers(sample, rng)
+
+        n_iter = 0
+        with mp.Pool(self.n_jobs or mp.cpu_count()) as pool:
+            for n_iter in range(1, self.max_iter + 1):
+                sums, counts, inertia = self._reduce(pool.imap_unordered(_chunk_statistics,
+                                                                         [(spec, means) for spec in specs]))
+                new_means = means.copy()
+                non_empty = counts > 0
+                new_means[non_empty] = sums[non_empty] / counts[non_empty, np.newaxis]
+                shift = np.sum((new_means - means) ** 2)
+                means = new_means
+                if shift <= tol:
+                    break
+
+        self.cluster_centers_ = means
+        self.counts_ = counts
+        # inertia of the last pass, measured against the centers before their last update
+        self.inertia_ = inertia
+        self.n_iter_ = n_iter
+        self.index_ = None
+        return self
+
+    @staticmethod
+    def _reduce(statistics):
+        total_sums, total_counts, total_inertia = None, None, 0.0
+        for sums, counts, inertia in statistics:
+            if total_sums is None:
+                total_sums, total_counts = sums, counts
+            else:
+                total_sums += sums
+                total_counts += counts
+            total_inertia += inertia
+        return total_sums, total_counts, total_inertia
+
+    def iter_labels(self, source):
+        """
+        label the source against the fitted centers, chunk by chunk and in order
+        :return: generator of int32 label arrays, one per chunk
+        """
+        specs = chunk_specs(source, self.chunk_rows)
+        with mp.Pool(self.n_jobs or mp.cpu_count()) as pool:
+            for labels in pool.imap(_chunk_labels, [(spec, self.cluster_centers_) for spec in specs]):
+                yield labels
@@ -2,7 +2,6 @@ import configparser
 import os
 import socket
 import sys
-import yaml
 
 
 def get_hostname():
@@ -81,6 +80,7 @@ class PortConfig(Config):
 
 class YamlConfig:
     def __init__(self, path):
+        import yaml
         self._path = path
         with open(path, 'r') as ymlfile:
             self._cfg = yaml.load(ymlfile)
@@ -89,6 +89,7 @@ class YamlConfig:
         return self._cfg[key]
 
     def set(self, key, val):
+        import yaml
         self._cfg[key] = val
         with open(self._path, 'w') as ymlfile:
             ymlfile.write(yaml.dump(self._cfg, default_flow_style=False))
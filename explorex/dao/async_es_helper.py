@@ -0,0 +1,137 @@
+"""
+asyncio flavour of ESDataProvider: the blocking client calls run in a thread pool, at most max_concurrency of them at
+a time, and the get calls issued within mget_window seconds of each other are sent as one mget per (index, type).
+e.g.:
+async with AsyncESDataProvider('dev') as provider:
+    docs = await asyncio.gather(*[provider.get_type_1_index_2(i) for i in ids])
+    hits = await provider.search_type_2_type_2({"query": {"match_all": {}}})
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from .data_tunnel import BasicTunnel, PortMappingConf, tunnel_manager
+from .es_helper import ESDataProvider, get_client
+
+
+class AsyncESDataProvider:
+    _es_type_index = ESDataProvider._es_type_index
+
+    def __init__(self, env, max_concurrency=16, mget_window=0.005, mget_max_batch=1000):
+        """
+        :param env: 'dev', 'stg' or 'prd'
+        :param max_concurrency: maximum requests in flight, also the size of the connection pool
+        :param mget_window: seconds a get waits for other gets to share its mget
+        :param mget_max_batch: maximum ids per mget, a full batch is sent right away
+        """
+        self.max_concurrency = max_concurrency
+        self.mget_window = mget_window
+        self.mget_max_batch = mget_max_batch
+        self._tunnel_conf = PortMappingConf(env, 'es')
+        self._es = get_client("{0}:{1}".format(self._tunnel_conf.local_addr, self._tunnel_conf.local_addr_port),
+                              max_concurrency)
+        self._executor = ThreadPoolExecutor(max_concurrency)
+        # created in the running loop on first use
+        self._semaphore = None
+        self._lease_lock = None
+        self._pending = {}
+        self._timers = {}
+        # mget tasks in flight, awaited by close
+        self._tasks = set()
+        self._leased = False
+        self._create_attr()
+
+    @property
+    def tunnel_conf(self):
+        return self._tunnel_conf
+
+    async def open(self):
+        """
+        hold a lease on the shared tunnel for the lifetime of the provider, instead of one tunnel per call. the first
+        request takes it when the provider is used without open or async with, close releases it
+        """
+        if self._lease_lock is None:
+            self._lease_lock = asyncio.Lock()
+        async with self._lease_lock:
+            if not self._leased:
+                await asyncio.get_event_loop().run_in_executor(
+                    self._executor, tunnel_manager.acquire, self._tunnel_conf, BasicTunnel.forwarder)
+                self._leased = True
+        return self
+
+    async def close(self):
+        """
+        send the pending gets and wait for every request in flight before releasing the tunnel
+        """
+        for key in list(self._pending):
+            self._flush(key)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        # the searches of other tasks may still be running in the executor
+        await asyncio.get_event_loop().run_in_executor(None, self._executor.shutdown)
+        if self._leased:
+            tunnel_manager.release(self._tunnel_conf)
+            self._leased = False
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _run(self, fn, *args, **kwargs):
+        if not self._leased:
+            await self.open()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            return await asyncio.get_event_loop().run_in_executor(self._executor, partial(fn, *args, **kwargs))
+
+    async def _search(self, es_index, es_type, es_query):
+        return await self._run(self._es.search, index=es_index, doc_type=es_type, body=es_query)
+
+    async def _get(self, es_index, es_type, es_id):
+        """
+        :return: the document as returned by mget, with found set to False when it does not exist
+        """
+        key = (es_index, es_type)
+        future = asyncio.get_event_loop().create_future()
+        batch = self._pending.setdefault(key, [])
+        batch.append((es_id, future))
+        if len(batch) >= self.mget_max_batch:
+            self._flush(key)
+        elif len(batch) == 1:
+            self._timers[key] = asyncio.get_event_loop().call_later(self.mget_window, self._flush, key)
+        return await future
+
+    def _flush(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(key, None)
+        if batch:
+            task = asyncio.ensure_future(self._mget(key, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _mget(self, key, batch):
+        es_index, es_type = key
+        ids = list(dict.fromkeys(str(es_id) for es_id, _ in batch))
+        try:
+            res = await self._run(self._es.mget, index=es_index, doc_type=es_type, body={'ids': ids})
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        docs = {doc['_id']: doc for doc in res['docs']}
+        for es_id, future in batch:
+            if not future.done():
+                future.set_result(docs.get(str(es_id), {'_id': str(es_id), 'found': False}))
+
+    def _create_attr(self):
+        for conf in self._es_type_index:
+            for fn in ['search', 'get']:
+                setattr(self, '{}_{}_{}'.format(fn, conf[0], conf[1]),
+                        partial(getattr(self, "_%s" % fn), conf[0], conf[1]))
@@ -3,8 +3,12 @@ more detail about class decorating, please view following page:
 https://www.codementor.io/sheena/advanced-use-python-decorators-class-function-du107nxsv
 """
 
-
-from sshtunnel import SSHTunnelForwarder
+import atexit
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
 
 from ..conf import PortConfig
 
@@ -29,10 +33,18 @@ class PortMappingConf:
 
     }
 
+    # local port of every (env, source), so all the confs of one destination share a single tunnel
+    _local_ports = {}
+    _ports_lock = threading.Lock()
+
     def __init__(self, env, source):
+        self.env, self.source = env, source
         self.relay_dst_addr, self.dst_addr, self.dst_addr_port = self._mapping[env][source]
         self.local_addr = '127.0.0.1'
-        self.local_addr_port = self._get_open_port()
+        with self._ports_lock:
+            if (env, source) not in self._local_ports:
+                self._local_ports[(env, source)] = self._get_open_port()
+            self.local_addr_port = self._local_ports[(env, source)]
 
     def __str__(self):
         return "relay address:       {}\n" \
@@ -58,6 +70,119 @@ class PortMappingConf:
     def mapping(self):
         return self._mapping
 
+    @property
+    def key(self):
+        return self.env, self.source
+
+
+class _SharedTunnel:
+    def __init__(self):
+        self.server = None
+        self.refs = 0
+        self.released_at = time.time()
+        self.timer = None
+        # held through the ssh handshake, which only blocks the users of this tunnel
+        self.lock = threading.Lock()
+
+
+class TunnelManager:
+    """
+    keeps one ssh tunnel per (env, source) alive and shares it across calls and threads.
+    every user holds a reference while it talks through the tunnel, a tunnel left without references is closed after
+    idle_timeout seconds, and a tunnel found dropped when acquired is re-established. the manager lock only guards the
+    references, the ssh handshakes run under the lock of their tunnel so they do not hold up the other tunnels.
+    e.g.:
+    with tunnel_manager.lease(port_map, factory):
+        ...
+    """
+
+    def __init__(self, idle_timeout=300):
+        self.idle_timeout = idle_timeout
+        self._lock = threading.RLock()
+        self._tunnels = {}
+
+    def acquire(self, port_map, factory):
+        """
+        :param port_map: PortMappingConf of the destination
+        :param factory: builds a new SSHTunnelForwarder for port_map when there is no live one
+        :return: the started forwarder
+        """
+        with self._lock:
+            tunnel = self._tunnels.get(port_map.key)
+            if tunnel is None:
+                tunnel = self._tunnels[port_map.key] = _SharedTunnel()
+            if tunnel.timer is not None:
+                tunnel.timer.cancel()
+                tunnel.timer = None
+            # the reference keeps close_idle away from the tunnel during the handshake
+            tunnel.refs += 1
+        try:
+            with tunnel.lock:
+                if tunnel.server is None:
+                    server = factory(port_map)
+                    server.start()
+                    tunnel.server = server
+                elif not tunnel.server.is_active:
+                    print("tunnel to {} dropped, re-establishing".format(port_map.dst_addr))
+                    tunnel.server.restart()
+                return tunnel.server
+        except Exception:
+            self.release(port_map)
+            raise
+
+    def release(self, port_map):
+        with self._lock:
+            tunnel = self._tunnels.get(port_map.key)
+            if tunnel is None:
+                return
+            tunnel.refs -= 1
+            if tunnel.refs == 0 and tunnel.server is None:
+                # its handshake failed
+                del self._tunnels[port_map.key]
+            elif tunnel.refs == 0:
+                tunnel.released_at = time.time()
+                tunnel.timer = threading.Timer(self.idle_timeout, self.close_idle)
+                tunnel.timer.daemon = True
+                tunnel.timer.start()
+
+    @contextmanager
+    def lease(self, port_map, factory):
+        server = self.acquire(port_map, factory)
+        try:
+            yield server
+        finally:
+            self.release(port_map)
+
+    def close_idle(self):
+        """
+        close the tunnels without references that have been idle for idle_timeout seconds
+        """
+        now = time.time()
+        idle = []
+        with self._lock:
+            for key, tunnel in list(self._tunnels.items()):
+                if tunnel.refs == 0 and now - tunnel.released_at >= self.idle_timeout:
+                    idle.append(tunnel)
+                    del self._tunnels[key]
+        # a later acquire of the same key starts a new tunnel
+        for tunnel in idle:
+            tunnel.server.stop()
+
+    def close_all(self):
+        with self._lock:
+            tunnels = list(self._tunnels.values())
+            self._tunnels.clear()
+        for tunnel in tunnels:
+            if tunnel.timer is not None:
+                tunnel.timer.cancel()
+            with tunnel.lock:
+                if tunnel.server is not None:
+                    tunnel.server.stop()
+
+
+tunnel_manager = TunnelManager()
+atexit.register(tunnel_manager.close_all)
+
 
 class BasicTunnel:
     """
@@ -67,30 +192,60 @@ class BasicTunnel:
         @BasicTunnel
         def foo():
             pass
+
+    the decorated calls share the tunnel kept by tunnel_manager for the tunnel_conf of the instance, an instance with
+    a true per_call_tunnel attribute opens and closes a dedicated tunnel around every call instead.
+    port.ini and sshtunnel are only loaded when the first tunnel is opened, not when the class is defined.
+    a decorated generator method keeps its tunnel until the generator is exhausted or closed.
     """
-    _port_conf = PortConfig()
-    _user = _port_conf.get_user()
-    _pass = _port_conf.get_passwd()
+    _credentials = None
 
     def __init__(self, func):
         self._func = func
 
-    def __call__(self, *args, **kwargs):
-        port_map = self.obj.tunnel_conf
-        with SSHTunnelForwarder(
-                port_map.relay_dst_addr,
-                ssh_username=self._user,
-                ssh_password=self._pass,
-                local_bind_address=(port_map.local_addr, port_map.local_addr_port),
-                remote_bind_address=(port_map.dst_addr, port_map.dst_addr_port)
-        ) as server:
-            server.start()
-            res = self._func(self.obj, *args, **kwargs)
-            server.stop()
-        return res
+    @staticmethod
+    def credentials():
+        if BasicTunnel._credentials is None:
+            port_conf = PortConfig()
+            BasicTunnel._credentials = (port_conf.get_user(), port_conf.get_passwd())
+        return BasicTunnel._credentials
+
+    @classmethod
+    def forwarder(cls, port_map):
+        from sshtunnel import SSHTunnelForwarder
+        user, password = cls.credentials()
+        return SSHTunnelForwarder(
+            port_map.relay_dst_addr,
+            ssh_username=user,
+            ssh_password=password,
+            local_bind_address=(port_map.local_addr, port_map.local_addr_port),
+            remote_bind_address=(port_map.dst_addr, port_map.dst_addr_port)
+        )
+
+    def _tunnel(self, obj):
+        if getattr(obj, 'per_call_tunnel', False):
+            return self.forwarder(obj.tunnel_conf)
+        return tunnel_manager.lease(obj.tunnel_conf, self.forwarder)
+
+    def _stream(self, obj, *args, **kwargs):
+        with self._tunnel(obj):
+            yield from self._func(obj, *args, **kwargs)
+
+    def __call__(self, obj, *args, **kwargs):
+        if inspect.isgeneratorfunction(self._func):
+            return self._stream(obj, *args, **kwargs)
+        port_map = obj.tunnel_conf
+        if getattr(obj, 'per_call_tunnel', False):
+            with self.forwarder(port_map) as server:
+                res = self._func(obj, *args, **kwargs)
+                server.stop()
+            return res
+
+        with tunnel_manager.lease(port_map, self.forwarder):
+            return self._func(obj, *args, **kwargs)
 
     def __get__(self, instance, owner):
-        self.cls = owner
-        self.obj = instance
-
-        return self.__call__
\ No newline at end of file
+        # bind per access instead of storing the instance on the shared descriptor, which is not thread safe
+        if instance is None:
+            return self
+        return partial(self.__call__, instance)
@@ -1,15 +1,192 @@
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 
 from elasticsearch import Elasticsearch
-from elasticsearch import helpers
 
 from .data_tunnel import BasicTunnel, PortMappingConf
-from ..utils.operator_util import file_cache
+from .projection import merge_docvalues, project_query, required_fields
+from ..utils.file_util import file_cache, save_json_stream
+from ..utils.frame_builder import scan_to_frames
 
 """
 This is designed for dealing with data related to testbed ES, since those servers are not blocked.
 """
 
+# default size of the connection pool of every client, i.e. concurrent requests to one host without reconnecting
+CLIENT_POOL_SIZE = 10
+
+_clients = {}
+_clients_lock = threading.Lock()
+_clients_pid = os.getpid()
+
+
+def _reset_clients():
+    """
+    a forked child must not share the sockets of its parent, it starts with an empty registry
+    """
+    global _clients, _clients_lock, _clients_pid
+    _clients, _clients_lock, _clients_pid = {}, threading.Lock(), os.getpid()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_clients)
+
+
+def get_client(hostname, pool_size=None):
+    """
+    Elasticsearch client shared by every call to the same host (or tunnel endpoint) in this process, so connections
+    are kept alive between calls. thread safe, and a pool worker gets its own clients after a fork
+    :param hostname: e.g. 'xxx-host-test-06' or 'localhost:9201'
+    :param pool_size: connections kept per client, CLIENT_POOL_SIZE if not set
+    :return: Elasticsearch client
+    """
+    if os.getpid() != _clients_pid:
+        _reset_clients()
+    key = (hostname, pool_size or CLIENT_POOL_SIZE)
+    with _clients_lock:
+        es = _clients.get(key)
+        if es is None:
+            es = _clients[key] = Elasticsearch([hostname], maxsize=key[1])
+        return es
+
+
+def close_clients():
+    with _clients_lock:
+        for es in _clients.values():
+            es.transport.close()
+        _clients.clear()
+
+
+def iter_scroll(es, es_index, es_type, query, scroll='2m', search_type='scan'):
+    """
+    scroll through the hits of the query page by page, the scroll context is cleared once the scan is exhausted or
+    as soon as the consumer closes the generator
+    :param es: Elasticsearch client
+    :param search_type: None for the regular search type, e.g. on sliced scrolls
+    :return: generator of lists of hits, one per page
+    """
+    page = es.search(
+        index=es_index,
+        doc_type=es_type,
+        scroll=scroll,
+        search_type=search_type,
+        size=query.get('size') or 1000,
+        body=query)
+    sid = page['_scroll_id']
+    try:
+        scroll_size = page['hits']['total']
+        if isinstance(scroll_size, dict):
+            scroll_size = scroll_size['value']
+        # a scan search type returns no hit on the first page, newer versions do
+        if page['hits']['hits']:
+            yield page['hits']['hits']
+        while scroll_size > 0:
+            print("Scrolling...")
+            page = es.scroll(scroll_id=sid, scroll=scroll)
+            # Update the scroll ID
+            sid = page['_scroll_id']
+            # Get the number of results that we returned in the last scroll
+            scroll_size = len(page['hits']['hits'])
+            print("scroll size: " + str(scroll_size))
+            if scroll_size:
+                yield page['hits']['hits']
+    finally:
+        try:
+            es.clear_scroll(scroll_id=sid)
+        except Exception as e:
+            print("failed to clear scroll {}: {}".format(sid, e))
+
+
+def iter_hits(pages):
+    """
+    flatten a generator of pages into hits, closing the pages (and so the scroll) when the consumer stops early
+    """
+    try:
+        for hits in pages:
+            yield from hits
+    finally:
+        pages.close()
+
+
+def slice_queries(query, n_slices):
+    """
+    :return: the query split into n_slices sliced scroll queries
+    """
+    return [dict(query, slice={'id': i, 'max': n_slices}) for i in range(n_slices)]
+
+
+def iter_sliced_scroll(es, es_index, es_type, query, n_slices, n_jobs=None, scroll='2m', max_pending=4):
+    """
+    sliced scroll: the query is split into n_slices slices scrolled concurrently by a thread pool, their pages are
+    merged into one stream in arrival order. every slice keeps at most max_pending pages ahead of the consumer, and
+    when the consumer closes the generator the slices stop and clear their scroll contexts
+    :param n_jobs: threads, one per slice if not set
+    :return: generator of lists of hits
+    """
+    pages = queue.Queue(maxsize=n_slices * max_pending)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def run(slice_query):
+        try:
+            scroller = iter_scroll(es, es_index, es_type, slice_query, scroll, search_type=None)
+            try:
+                for hits in scroller:
+                    if not put((True, hits)):
+                        break
+            finally:
+                scroller.close()
+            put((True, None))
+        except Exception as e:
+            put((False, e))
+
+    pool = ThreadPoolExecutor(n_jobs or n_slices)
+    try:
+        for slice_query in slice_queries(query, n_slices):
+            pool.submit(run, slice_query)
+        running = n_slices
+        while running:
+            ok, hits = pages.get()
+            if not ok:
+                raise hits
+            if hits is None:
+                running -= 1
+            else:
+                yield hits
+    finally:
+        stop.set()
+        pool.shutdown(wait=True)
+
+
+def export_sliced_scroll(es, es_index, es_type, query, n_slices, out_dir, n_jobs=None, scroll='2m'):
+    """
+    sliced scroll writing every slice to its own json file, out_dir/<es_index>_<slice>.json, as the pages arrive
+    :return: list of (filename, number of hits) per slice
+    """
+    def run(i, slice_query):
+        filename = os.path.join(out_dir, "{}_{}.json".format(es_index, i))
+        count = 0
+        for hits in save_json_stream(filename, iter_scroll(es, es_index, es_type, slice_query, scroll,
+                                                            search_type=None)):
+            count += len(hits)
+        return filename, count
+
+    with ThreadPoolExecutor(n_jobs or n_slices) as pool:
+        return list(pool.map(run, range(n_slices), slice_queries(query, n_slices)))
+
 
 @file_cache
 def scan_data(hostname, es_index, es_type, query):
@@ -21,59 +198,195 @@ def scan_data(hostname, es_index, es_type, query):
     :param query:
     :return:
     """
-    es = Elasticsearch([hostname])
+    es = get_client(hostname)
+    res = []
+    for hits in iter_scroll(es, es_index, es_type, query):
+        res += hits
+    return res
 
-    page = es.search(
-        index=es_index,
-        doc_type=es_type,
-        scroll='2m',
-        search_type='scan',
-        size=query.get('size') or 1000,
-        body=query)
-    sid = page['_scroll_id']
-    scroll_size = page['hits']['total']
 
-    res = []
-    # Start scrolling
-    while scroll_size > 0:
-        print("Scrolling...")
-        page = es.scroll(scroll_id=sid, scroll='2m')
-        # Update the scroll ID
-        sid = page['_scroll_id']
-        # Get the number of results that we returned in the last scroll
-        scroll_size = len(page['hits']['hits'])
-        res += page['hits']['hits']
-        print("scroll size: " + str(scroll_size))
+@file_cache
+def scan_data_pages(hostname, es_index, es_type, query):
+    """
+    streaming scan_data, hits are yielded page by page as they arrive and the cache file is written along the way.
+    it shares its cache file with scan_data, a cache hit yields the cached sources in pages of cache_batch_size.
+    e.g.:
+    for hit in iter_hits(scan_data_pages('xxx-host-test-06', 'some_index', 'some_type', query)):
+        ...
+    :return: generator of lists of hits
+    """
+    es = get_client(hostname)
+    yield from iter_scroll(es, es_index, es_type, query)
 
-    return res
+
+@file_cache
+def _scan_data_projected(hostname, es_index, es_type, query, fields, docvalue_fields):
+    es = get_client(hostname)
+    for hits in iter_scroll(es, es_index, es_type, project_query(query, fields, docvalue_fields)):
+        yield merge_docvalues(hits, docvalue_fields)
+
+
+def scan_data_projected(hostname, es_index, es_type, query, columns=None, tasks=None, docvalue_fields=(), **kwargs):
+    """
+    scan_data_pages fetching only the fields used downstream, see projection.required_fields.
+    the fields are part of the cache key, so scans of different projections never share a cache file
+    :param columns: explicit list of the needed fields
+    :param tasks: TaskBuilder.build_task() result whose column arguments are needed
+    :param docvalue_fields: needed fields to read from doc values, see projection.docvalue_fields_from_mapping
+    :param kwargs: file_cache options, e.g. force_fetch
+    :return: generator of lists of hits
+    """
+    fields = tuple(required_fields(tasks, columns))
+    return _scan_data_projected(hostname, es_index, es_type, query, fields,
+                                tuple(f for f in docvalue_fields if f in fields), **kwargs)
 
 
-def batch_insert_data(hostname, es_index, es_type, data):
+def scan_data_frames(hostname, es_index, es_type, query, pages_per_frame=None, include_id=False, **kwargs):
+    """
+    scan_data_pages straight into DataFrames, see frame_builder.scan_to_frames
+    :param kwargs: file_cache options, e.g. force_fetch
+    :return: generator of DataFrames, one every pages_per_frame pages or a single one if not set
+    """
+    return scan_to_frames(scan_data_pages(hostname, es_index, es_type, query, **kwargs), pages_per_frame, include_id)
+
+
+@file_cache
+def scan_data_sliced(hostname, es_index, es_type, query, n_slices):
+    """
+    scan_data_pages over n_slices concurrently scrolled slices, see iter_sliced_scroll
+    :return: generator of lists of hits
+    """
+    es = get_client(hostname, max(n_slices, CLIENT_POOL_SIZE))
+    yield from iter_sliced_scroll(es, es_index, es_type, query, n_slices)
+
+
+# statuses of bulk items rejected because the cluster is overloaded, they are worth retrying
+RETRY_STATUSES = (429, 503)
+
+
+def _line_bytes(lines):
+    return len(lines[0].encode('utf-8')) + len(lines[1].encode('utf-8')) + 2
+
+
+def iter_bulk_chunks(data, es_index, es_type, chunk_size=500, max_chunk_bytes=10 * 1024 * 1024, dumps=json.dumps):
+    """
+    serialize the records into bulk index lines, grouped into chunks of at most chunk_size records and about
+    max_chunk_bytes bytes, without materializing more than one chunk
+    :param data: iterable of ES records, each holding an optional '_id' and its '_source'
+    :param dumps: serializer of the lines, the client's one (es.transport.serializer.dumps) handles numpy, pandas,
+    datetime and decimal values
+    :return: generator of lists of (action line, source line)
+    """
+    chunk, chunk_bytes = [], 0
+    for d in data:
+        action = {"_index": es_index, "_type": es_type}
+        if d.get('_id') is not None:
+            action["_id"] = d['_id']
+        lines = (dumps({"index": action}), dumps(d.get('_source')))
+        size = _line_bytes(lines)
+        if chunk and (len(chunk) == chunk_size or chunk_bytes + size > max_chunk_bytes):
+            yield chunk
+            chunk, chunk_bytes = [], 0
+        chunk.append(lines)
+        chunk_bytes += size
+    if chunk:
+        yield chunk
+
+
+def send_bulk_chunk(es, chunk, max_retries=5, initial_backoff=0.5, max_backoff=30):
+    """
+    send one chunk, the items rejected with a RETRY_STATUSES status (or the whole chunk if the request fails) are
+    sent again after an exponential backoff: initial_backoff * 2 ** attempt seconds, at most max_backoff
+    :return: dict of the chunk stats
+    """
+    stats = {'docs': len(chunk), 'bytes': sum(_line_bytes(lines) for lines in chunk), 'ok': 0, 'failed': 0,
+             'retries': 0}
+    start = time.time()
+    pending = chunk
+    for attempt in range(max_retries + 1):
+        if attempt:
+            stats['retries'] += 1
+            time.sleep(min(max_backoff, initial_backoff * 2 ** (attempt - 1)))
+        body = ''.join("{}\n{}\n".format(a, s) for a, s in pending)
+        try:
+            res = es.bulk(body=body)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            print("bulk request failed ({}), retrying {} docs".format(e, len(pending)))
+            continue
+        rejected = []
+        for lines, item in zip(pending, res['items']):
+            status = item['index']['status']
+            if status < 300:
+                stats['ok'] += 1
+            elif status in RETRY_STATUSES:
+                rejected.append(lines)
+            else:
+                stats['failed'] += 1
+        pending = rejected
+        if not pending:
+            break
+    stats['failed'] += len(pending)
+    stats['seconds'] = time.time() - start
+    stats['docs_per_sec'] = stats['docs'] / stats['seconds'] if stats['seconds'] > 0 else float('inf')
+    return stats
+
+
+def streaming_bulk_insert(es, data, es_index, es_type, chunk_size=500, max_chunk_bytes=10 * 1024 * 1024, n_jobs=4,
+                          max_retries=5, initial_backoff=0.5, max_backoff=30):
+    """
+    bulk index an iterable of records from a pool of n_jobs threads. at most 2 * n_jobs chunks are in flight, beyond
+    that reading data blocks until a chunk is sent, so memory stays bounded whatever the size of data
+    :param data: iterable (e.g. generator) of ES records, each holding an optional '_id' and its '_source'
+    :return: list of the stats dict of every chunk, in order: docs, bytes, ok, failed, retries, seconds, docs_per_sec
+    """
+    slots = threading.BoundedSemaphore(2 * n_jobs)
+
+    def send(chunk):
+        try:
+            return send_bulk_chunk(es, chunk, max_retries, initial_backoff, max_backoff)
+        finally:
+            slots.release()
+
+    futures = []
+    with ThreadPoolExecutor(n_jobs) as pool:
+        for chunk in iter_bulk_chunks(data, es_index, es_type, chunk_size, max_chunk_bytes,
+                                      es.transport.serializer.dumps):
+            slots.acquire()
+            futures.append(pool.submit(send, chunk))
+    stats = [f.result() for f in futures]
+    for i, chunk_stats in enumerate(stats):
+        chunk_stats['chunk'] = i
+    print("bulk inserted {} docs in {} chunks, {} failed".format(
+        sum(c['ok'] for c in stats), len(stats), sum(c['failed'] for c in stats)))
+    return stats
+
+
+def batch_insert_data(hostname, es_index, es_type, data, **kwargs):
     """
     batch insert data into ES
     :param hostname: e.g. 'xxx-host-test-06'
     :param es_index: e.g. 'some_index'
     :param es_type: e.g. 'some_type'
-    :param data: python build in array-like data, each is an ES record
-    :return:
+    :param data: python build in array-like data or generator, each is an ES record
+    :param kwargs: passed to streaming_bulk_insert, e.g. chunk_size, n_jobs
+    :return: per chunk stats
     """
-    es = Elasticsearch([hostname])
-    actions = [
-        {"_index": es_index, "_type": es_type, "_id": d.get('_id'), "_source": d.get('_source')} for d
-        in data]
-    helpers.bulk(es, actions)
+    es = get_client(hostname, max(kwargs.get('n_jobs', 4), CLIENT_POOL_SIZE))
+    return streaming_bulk_insert(es, data, es_index, es_type, **kwargs)
 
 
 def search_data(hostname, es_index, es_type, query=None):
     if query is None:
         query = {"query": {"match_all": {}}}
-    es = Elasticsearch([hostname])
+    es = get_client(hostname)
     res = es.search(index=es_index, doc_type=es_type, body=query)
     return res['hits']['hits']
 
 
 def fetch_data(hostname, es_index, es_type, es_id):
-    es = Elasticsearch([hostname])
+    es = get_client(hostname)
     return es.get(es_index, es_id, doc_type=es_type)
 
 
@@ -84,9 +397,14 @@ class ESDataProvider:
         ('type_3', 'type_3')
     ]
 
-    def __init__(self, env):
+    def __init__(self, env, per_call_tunnel=False):
+        """
+        :param env: 'dev', 'stg' or 'prd'
+        :param per_call_tunnel: open a dedicated ssh tunnel around every call instead of sharing the pooled one
+        """
+        self.per_call_tunnel = per_call_tunnel
         self._tunnel_conf = PortMappingConf(env, 'es')
-        self._es = Elasticsearch(["{0}:{1}".format(self._tunnel_conf.local_addr, self._tunnel_conf.local_addr_port)])
+        self._es = get_client("{0}:{1}".format(self._tunnel_conf.local_addr, self._tunnel_conf.local_addr_port))
         self._create_attr()
 
     @property
@@ -106,39 +424,41 @@ class ESDataProvider:
         return self._es.index(index, doc_type, body, id=id, params=None)
 
     @BasicTunnel
-    def _scan(self, es_index, es_type, query):
-        page = self._es.search(
-            index=es_index,
-            doc_type=es_type,
-            scroll='2m',
-            search_type='scan',
-            size=query.get('size') or 1000,
-            body=query)
-        sid = page['_scroll_id']
-        scroll_size = page['hits']['total']
+    def _scan_pages(self, es_index, es_type, query):
+        """
+        :return: generator of lists of hits, holding the tunnel until it is exhausted or closed
+        """
+        yield from iter_scroll(self._es, es_index, es_type, query)
 
-        res = []
-        while scroll_size > 0:
-            print("Scrolling...")
-            page = self._es.scroll(scroll_id=sid, scroll='2m')
-            sid = page['_scroll_id']
-            scroll_size = len(page['hits']['hits'])
-            res += page['hits']['hits']
-            print("scroll size: " + str(scroll_size))
+    @BasicTunnel
+    def _scan_projected(self, es_index, es_type, query, columns=None, tasks=None, docvalue_fields=()):
+        """
+        :return: generator of lists of hits restricted to the fields used downstream, see scan_data_projected
+        """
+        fields = required_fields(tasks, columns)
+        docvalue_fields = [f for f in docvalue_fields if f in fields]
+        for hits in iter_scroll(self._es, es_index, es_type, project_query(query, fields, docvalue_fields)):
+            yield merge_docvalues(hits, docvalue_fields)
+
+    @BasicTunnel
+    def _scan_slices(self, es_index, es_type, query, n_slices=4):
+        """
+        :return: generator of lists of hits of n_slices concurrently scrolled slices
+        """
+        yield from iter_sliced_scroll(self._es, es_index, es_type, query, n_slices)
 
+    def _scan(self, es_index, es_type, query):
+        res = []
+        for hits in self._scan_pages(es_index, es_type, query):
+            res += hits
         return res
 
     @BasicTunnel
-    def _bulk(self, es_index, es_type, data):
-        actions = [
-            {"_index": es_index,
-             "_type": es_type,
-             "_id": d.get('_id'),
-             "_source": d.get('_source')} for d in data]
-        helpers.bulk(self._es, actions)
+    def _bulk(self, es_index, es_type, data, **kwargs):
+        return streaming_bulk_insert(self._es, data, es_index, es_type, **kwargs)
 
     def _create_attr(self):
         for conf in self._es_type_index:
-            for fn in ['search', 'scan', 'bulk', 'get']:
+            for fn in ['search', 'scan', 'scan_pages', 'scan_projected', 'scan_slices', 'bulk', 'get']:
                 setattr(self, '{}_{}_{}'.format(fn, conf[0], conf[1]),
                         partial(getattr(self, "_%s" % fn), conf[0], conf[1]))
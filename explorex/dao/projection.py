@@ -0,0 +1,156 @@
+"""
+projection pushdown: only fetch from ES the fields the analysis uses.
+the fields come from an explicit column list and / or from the tasks of a TaskBuilder, whose column parameters (e.g.
+flatten_any(df, col='user'), time_aggregator(df, time_col='ts'), defaults included) name the fields they touch. when
+the fields of a task cannot be told that way the query is not projected. they are injected into the query as _source includes, and the
+fields stored as doc values can be read from docvalue_fields instead of parsing them out of _source.
+e.g.:
+task = TaskBuilder(None).add_tasks(flatten_any, ['user', 'device']).build_task()
+query = project_query(query, required_fields(tasks=task, columns=['timestamp']))
+"""
+
+import copy
+import inspect
+
+# mapping types whose values are stored as doc values by default
+DOCVALUE_TYPES = {'keyword', 'long', 'integer', 'short', 'byte', 'double', 'float', 'half_float', 'scaled_float',
+                  'date', 'boolean', 'ip'}
+
+# parameter names of the tasks naming columns, as is or as a suffix (e.g. time_col)
+_COLUMN_PARAMS = ('col', 'cols', 'column', 'columns')
+
+
+def _is_column_param(name):
+    return any(name == p or name.endswith('_' + p) for p in _COLUMN_PARAMS)
+
+
+def _column_values(value):
+    """
+    :return: list of the column names of a parameter value, None when it does not name columns (e.g. col=None, i.e.
+    every column)
+    """
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, (list, tuple, set)) and value and all(isinstance(v, str) for v in value):
+        return list(value)
+    return None
+
+
+def _task_columns(t):
+    """
+    :param t: task dict of a TaskBuilder, called as task(df, *args, **kwargs)
+    :return: set of the columns the task reads, None when they cannot be told
+    """
+    try:
+        bound = inspect.signature(t['task']).bind_partial(None, *t.get('args', ()), **t.get('kwargs', {}))
+    except (TypeError, ValueError):
+        return None
+    bound.apply_defaults()
+    parameters = bound.signature.parameters
+    columns = set()
+    for name, value in bound.arguments.items():
+        if parameters[name].kind in (inspect.Parameter.VAR_POSITIONAL, inspect.Parameter.VAR_KEYWORD):
+            continue
+        if not _is_column_param(name):
+            continue
+        values = _column_values(value)
+        if values is None:
+            return None
+        columns.update(values)
+    # a task without column parameters may read any column
+    return columns or None
+
+
+def task_fields(tasks):
+    """
+    :param tasks: TaskBuilder.build_task() result or its list of tasks
+    :return: set of the columns named by the column parameters of the tasks, defaults included, None when the columns
+    of a task cannot be told
+    """
+    if isinstance(tasks, dict):
+        tasks = tasks['tasks']
+    fields = set()
+    for t in tasks:
+        columns = _task_columns(t)
+        if columns is None:
+            return None
+        fields |= columns
+    return fields
+
+
+def required_fields(tasks=None, columns=None):
+    """
+    :return: sorted list of the fields needed by the tasks and the explicit columns, empty when nothing restricts them
+    or when the fields of a task cannot be told, i.e. the whole _source is needed
+    """
+    fields = set(columns or ())
+    if tasks is not None:
+        needed = task_fields(tasks)
+        if needed is None:
+            return []
+        fields |= needed
+    return sorted(fields)
+
+
+def docvalue_fields_from_mapping(mapping, fields):
+    """
+    :param mapping: properties of the type mapping, e.g. es.indices.get_mapping(...)[index]['mappings'][type]
+    :param fields: dotted field names
+    :return: the fields that are leaves of a doc values type, which can go to docvalue_fields
+    """
+    properties = mapping.get('properties', mapping)
+    selected = []
+    for field in fields:
+        node = {'properties': properties}
+        for part in field.split('.'):
+            node = node.get('properties', {}).get(part)
+            if node is None:
+                break
+        if node is not None and node.get('type') in DOCVALUE_TYPES and node.get('doc_values', True):
+            selected.append(field)
+    return selected
+
+
+def project_query(query, fields, docvalue_fields=()):
+    """
+    :param query: ES query body, left untouched
+    :param fields: fields to fetch, the query is returned as is when empty
+    :param docvalue_fields: subset of the fields read from doc values instead of _source
+    :return: a copy of the query restricted to the fields
+    """
+    if not fields:
+        return query
+    projected = copy.deepcopy(query)
+    docvalue_fields = [f for f in fields if f in set(docvalue_fields)]
+    includes = [f for f in fields if f not in set(docvalue_fields)]
+    # an empty includes list would mean the whole _source
+    projected['_source'] = {'includes': includes} if includes else False
+    if docvalue_fields:
+        projected['docvalue_fields'] = docvalue_fields
+    return projected
+
+
+def merge_docvalues(hits, docvalue_fields):
+    """
+    move the docvalue_fields of the hits into their _source, at their dotted path, so the hits look the same as
+    without doc values. single values are unwrapped from the lists ES returns them in
+    :return: the hits, updated in place
+    """
+    if not docvalue_fields:
+        return hits
+    for hit in hits:
+        values = hit.pop('fields', {})
+        source = hit.get('_source') or {}
+        for field in docvalue_fields:
+            if field not in values:
+                continue
+            value = values[field]
+            if isinstance(value, list) and len(value) == 1:
+                value = value[0]
+            node = source
+            parts = field.split('.')
+            for part in parts[:-1]:
+                node = node.setdefault(part, {})
+            node[parts[-1]] = value
+        hit['_source'] = source
+    return hits
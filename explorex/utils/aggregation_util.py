@@ -6,11 +6,12 @@ TODO: generic aggregation is need to support multiple query or ad hoc query
 import re
 from collections import Counter
 
-import pandas as pd
-from numpy import nan, float64
-
+from explorex.utils.basic_util import lazy_import
 from explorex.utils.dataframe_util import implicit_to_dict
 
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
 
 def default_counter(df):
     return Counter(df.apply(lambda e: str(e)[:255])).items()
@@ -47,7 +48,7 @@ def dataframe_helper(df, data_type):
     """
     if data_type is str:
         return df.aggregate(string_counter)
-    if data_type is float or data_type is float64:
+    if data_type is float or data_type is np.float64:
         return df.aggregate(numeric_counter)
 
     return "type \"%s\" not supported!" % str(data_type)
@@ -83,7 +84,7 @@ def agg_helper(df):
     """
     df_notnull = df[df.notnull()]
     if df_notnull.size == 0:
-        return nan
+        return np.nan
     else:
         return dataframe_helper(df_notnull, type(df_notnull.iloc[0]))
 
@@ -5,8 +5,10 @@ though some aggregation operation offered by dataframe_util is now move to trans
 """
 
 import functools
+import importlib
 import inspect
 import time
+import types
 import warnings
 from functools import wraps
 
@@ -19,7 +21,8 @@ __all__ = ['safe_list_get',
            'normalize_json',
            'flatten_any',
            'flatten_array',
-           'logger']
+           'logger',
+           'lazy_import']
 
 
 def safe_list_get(l, idx, default):
@@ -80,6 +83,35 @@ def get_dict_val(deep_dict, path, default={}, sep="."):
     return res
 
 
+class LazyModule(types.ModuleType):
+    """
+    stand-in for a module that is only imported on first attribute access
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self.__name__)
+            self.__dict__.update(self._module.__dict__)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+
+def lazy_import(name):
+    """
+    defer heavy imports (pandas, scipy ...) until they are used, so importing explorex modules stays cheap for short
+    lived jobs and pool workers.
+    e.g.:
+    pd = lazy_import('pandas')
+    """
+    return LazyModule(name)
+
+
 def logger(fn):
     @wraps(fn)
     def wrapper(*args, **kwargs):
@@ -1,8 +1,10 @@
 from collections import Counter
 from functools import wraps
 
-import pandas as pd
-import numpy as np
+from explorex.utils.basic_util import lazy_import
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
 
 
 def normalize_json(j):
@@ -2,6 +2,8 @@
 The deal with interaction with files and provide cache functionality to other functions through log these data on files
 """
 
+import hashlib
+import inspect
 import json
 import os
 import pickle
@@ -10,6 +12,12 @@ from collections import Counter
 from functools import wraps
 
 from explorex.utils.dataframe_util import get_dict_item_cols, get_dict_cols
+from explorex.utils.record_store import RecordReader, RecordWriter, is_record_store
+
+# format of the new cache files: 'records' (compressed block store, see record_store) or 'json' (legacy)
+CACHE_FORMAT = 'records'
+
+_CACHE_EXTENSIONS = {'json': '.json', 'records': '.rec'}
 
 
 def save_json(filename, res):
@@ -26,7 +34,11 @@ def load_json(filename):
 def generate_cache_filename(kwargs):
     str_args = [str(k) for k in kwargs]
     seps = re.sub('[=\\\\/:*?"<>|\s()&,{}.\[\]\'\"]', "_", "_".join(str_args)).split("_")
-    return ("_".join(filter(lambda e: not e == '' and not e == ' ', seps)))[0:249] + ".json"
+    name = "_".join(filter(lambda e: not e == '' and not e == ' ', seps))
+    if len(name) > 249:
+        # keep the keys that only differ past the cut (e.g. the projected fields of a query) apart
+        name = name[0:232] + "_" + hashlib.sha1("_".join(str_args).encode('utf-8')).hexdigest()[0:16]
+    return name + ".json"
 
 
 def load_many_json(abs_dir, file_list):
@@ -37,39 +49,212 @@ def load_many_json(abs_dir, file_list):
     return res
 
 
+def cache_filename(args, cache_format=None):
+    """
+    :param cache_format: 'records' or 'json', CACHE_FORMAT if not set
+    """
+    cache_format = cache_format or CACHE_FORMAT
+    if cache_format not in _CACHE_EXTENSIONS:
+        raise ValueError("cache_format should be one of {}, got {}".format(list(_CACHE_EXTENSIONS), cache_format))
+    return generate_cache_filename(args)[:-len('.json')] + _CACHE_EXTENSIONS[cache_format]
+
+
+def find_cache_file(args, cache_format=None):
+    """
+    :return: the existing cache file of args, in the given format first then in the other one, None if there is none
+    """
+    cache_format = cache_format or CACHE_FORMAT
+    for fmt in [cache_format] + [f for f in _CACHE_EXTENSIONS if f != cache_format]:
+        filename = cache_filename(args, fmt)
+        if os.path.exists(filename):
+            return filename
+    return None
+
+
+def load_cache(filename):
+    if is_record_store(filename):
+        return list(RecordReader(filename))
+    return load_json(filename)
+
+
+def iter_cache(filename, batch_size=1000):
+    """
+    read a cache file lazily, whatever its format
+    :return: generator of lists of at most batch_size records
+    """
+    if not is_record_store(filename):
+        yield from iter_json(filename, batch_size)
+        return
+    batch = []
+    for records in RecordReader(filename).iter_blocks():
+        batch += records
+        while len(batch) >= batch_size:
+            yield batch[:batch_size]
+            batch = batch[batch_size:]
+    if batch:
+        yield batch
+
+
+def save_records(filename, res):
+    with RecordWriter(filename) as writer:
+        writer.write_many(res)
+
+
+def save_cache(filename, res):
+    if filename.endswith(_CACHE_EXTENSIONS['records']):
+        save_records(filename, res)
+    else:
+        save_json(filename, res)
+
+
 def fetch_from_cache(fetch_data_fun, *kwargs):
     force = True in kwargs
-    cache_file = generate_cache_filename(kwargs)
-    if os.path.exists(cache_file) and not force:
+    cache_file = find_cache_file(kwargs)
+    if cache_file is not None and not force:
         print("loading data from cache file: " + cache_file)
-        return load_json(cache_file)
+        return load_cache(cache_file)
     else:
+        cache_file = cache_filename(kwargs)
         data = fetch_data_fun(*kwargs)
         res = [d.get('_source', d) for d in data]
-        save_json(cache_file, res)
+        save_cache(cache_file, res)
         print("cache_file: " + cache_file + " is generated!")
         return res
 
 
+def iter_json(filename, batch_size=1000):
+    """
+    read a json list cache lazily, in batches of records. files written by save_json_stream hold one record per line
+    and are streamed, other json lists are loaded at once
+    :return: generator of lists of at most batch_size records
+    """
+    with open(filename, 'r') as f:
+        if f.readline().strip() != '[':
+            f.seek(0)
+            res = json.load(f)
+            for start in range(0, len(res), batch_size):
+                yield res[start:start + batch_size]
+            return
+        batch = []
+        for line in f:
+            line = line.strip().rstrip(',')
+            if not line or line == ']':
+                continue
+            batch.append(json.loads(line))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+class _JsonListWriter:
+    """
+    json list with one record per line, see iter_json
+    """
+
+    def __init__(self, filename):
+        self._file = open(filename, 'w')
+        self._file.write('[')
+        self._first = True
+
+    def write(self, record):
+        self._file.write('\n' if self._first else ',\n')
+        self._file.write(json.dumps(record))
+        self._first = False
+
+    def close(self):
+        if not self._file.closed:
+            self._file.write('\n]\n')
+            self._file.close()
+
+
+def _save_stream(filename, batches, writer_class):
+    """
+    write the records of the batches to filename while passing the batches through.
+    the records go to a temporary file that only replaces filename once batches is exhausted, a consumer stopping early
+    leaves no partial cache behind
+    """
+    tmp_file = "{}.{}.tmp".format(filename, os.getpid())
+    completed = False
+    writer = writer_class(tmp_file)
+    try:
+        for batch in batches:
+            for d in batch:
+                writer.write(d.get('_source', d))
+            yield batch
+        writer.close()
+        os.replace(tmp_file, filename)
+        completed = True
+        print("cache_file: " + filename + " is generated!")
+    finally:
+        if not completed:
+            writer.close()
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            # e.g. clears the scroll context of an ES scan right away
+            if hasattr(batches, 'close'):
+                batches.close()
+
+
+def save_json_stream(filename, batches):
+    """
+    stream the batches to filename as a json list, one record per line
+    :param batches: iterable of lists of records, a record being stored as its '_source' if it has one
+    :return: generator of the batches
+    """
+    return _save_stream(filename, batches, _JsonListWriter)
+
+
+def save_records_stream(filename, batches):
+    """
+    stream the batches to filename as a record store, see save_json_stream
+    """
+    return _save_stream(filename, batches, RecordWriter)
+
+
+def save_cache_stream(filename, batches):
+    if filename.endswith(_CACHE_EXTENSIONS['records']):
+        return save_records_stream(filename, batches)
+    return save_json_stream(filename, batches)
+
+
 def file_cache(fn):
+    """
+    cache the records returned by fn in a file named after the positional arguments, a record store or a json list
+    depending on the cache_format keyword argument (CACHE_FORMAT by default). a cache file in the other format is
+    still found and read.
+    fn can also be a generator function yielding batches (lists) of records, the cache is then written incrementally
+    as the batches stream through and a cache hit yields batches of cache_batch_size records
+    """
+    streaming = inspect.isgeneratorfunction(fn)
+
     @wraps(fn)
     def wrapper(*args, **kwargs):
         force = kwargs.pop('force_fetch', False)
         no_cache = kwargs.pop('no_cache', False)
+        batch_size = kwargs.pop('cache_batch_size', 1000) if streaming else None
+        cache_format = kwargs.pop('cache_format', None)
 
         if no_cache:
             data = fn(*args, **kwargs)
             return data
 
-        cache_file = generate_cache_filename(args)
-        print("lookup data from cache file: " + cache_file)
-        if os.path.exists(cache_file) and not force:
+        cache_file = find_cache_file(args, cache_format)
+        print("lookup data from cache file: " + (cache_file or cache_filename(args, cache_format)))
+        if cache_file is not None and not force:
             print("loading data from cache file: " + cache_file)
-            return load_json(cache_file)
+            if streaming:
+                return iter_cache(cache_file, batch_size)
+            return load_cache(cache_file)
+
+        cache_file = cache_filename(args, cache_format)
+        if streaming:
+            return save_cache_stream(cache_file, fn(*args, **kwargs))
         else:
             data = fn(*args, **kwargs)
             res = [d.get('_source', d) for d in data]
-            save_json(cache_file, res)
+            save_cache(cache_file, res)
             print("cache_file: " + cache_file + " is generated!")
             return data
 
@@ -0,0 +1,235 @@
+"""
+build DataFrames straight from ES pages: every page's flattened _source fields are appended to typed column buffers
+(numpy arrays, strings stored as categorical codes), so the documents never live as a list of dicts nor as a list of
+normalized rows, only one page at a time does.
+the columns are named like normalize_json does, nested fields joined with dots and without the '_source.' prefix.
+e.g.:
+for df in scan_to_frames(scan_data_pages(hostname, es_index, es_type, query), pages_per_frame=100):
+    ...
+"""
+
+from explorex.utils.basic_util import lazy_import
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+_MISSING = {'float': float('nan'), 'category': -1, 'object': None}
+
+
+def flatten_source(source, prefix=''):
+    """
+    {'a': {'b': 1}, 'c': [1, 2]} -> {'a.b': 1, 'c': [1, 2]}, lists are kept as values
+    """
+    flat = {}
+    for key, value in source.items():
+        name = prefix + key
+        if isinstance(value, dict) and value:
+            flat.update(flatten_source(value, name + '.'))
+        else:
+            flat[name] = value
+    return flat
+
+
+def _kind(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, str):
+        return 'category'
+    return 'object'
+
+
+def _promote(kinds, missing):
+    """
+    the narrowest kind holding all the kinds, and the missing values if any
+    """
+    if not kinds:
+        return None
+    if len(kinds) == 1:
+        kind = next(iter(kinds))
+    elif kinds <= {'int', 'float'}:
+        kind = 'float'
+    else:
+        kind = 'object'
+    if missing:
+        kind = {'int': 'float', 'bool': 'object'}.get(kind, kind)
+    return kind
+
+
+class ColumnBuffer:
+    """
+    growable typed array of one column, its kind is widened (int -> float -> object, category -> object) as values
+    that do not fit arrive. strings are stored as int32 codes into categories, which are kept across reset so the
+    codes of successive frames agree
+    """
+
+    def __init__(self, n_missing=0, categorical=True):
+        """
+        :param n_missing: rows already seen by the builder before the column first appeared
+        :param categorical: store strings as categorical codes, plain objects otherwise (e.g. for unique ids)
+        """
+        self.categorical = categorical
+        self.kind = None
+        self.size = n_missing
+        self.has_missing = n_missing > 0
+        self.categories = {}
+        self._data = None
+
+    def _allocate(self, kind, capacity):
+        dtype = {'bool': bool, 'int': np.int64, 'float': np.float64, 'category': np.int32, 'object': object}[kind]
+        data = np.empty(capacity, dtype=dtype)
+        if kind in _MISSING:
+            data[:] = _MISSING[kind]
+        return data
+
+    def _convert(self, kind):
+        capacity = max(16, self.size)
+        if self.kind is None:
+            self._data = self._allocate(kind, capacity)
+        elif self.kind == 'category':
+            codes = self._data
+            data = self._allocate(kind, len(codes))
+            labels = np.empty(len(self.categories), dtype=object)
+            labels[:] = list(self.categories)
+            valid = codes >= 0
+            data[valid] = labels[codes[valid]]
+            self._data = data
+        else:
+            self._data = self._data.astype(np.float64 if kind == 'float' else object)
+        self.kind = kind
+
+    def _encode(self, values):
+        if self.kind == 'category':
+            categories = self.categories
+            return np.array([-1 if v is None else categories.setdefault(v, len(categories)) for v in values],
+                            dtype=np.int32)
+        if self.kind == 'float':
+            return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+        if self.kind == 'object':
+            encoded = np.empty(len(values), dtype=object)
+            for i, v in enumerate(values):
+                encoded[i] = v
+            return encoded
+        return np.array(values, dtype=self._data.dtype)
+
+    def extend(self, values):
+        """
+        :param values: list of python values of one page, None for missing
+        """
+        missing = self.has_missing or any(v is None for v in values)
+        kinds = {_kind(v) for v in values} - {None}
+        if not self.categorical and 'category' in kinds:
+            kinds = (kinds - {'category'}) | {'object'}
+        if self.kind is not None:
+            kinds.add(self.kind)
+        kind = _promote(kinds, missing)
+        self.has_missing = missing
+        if kind != self.kind:
+            self._convert(kind)
+        if kind is None:
+            self.size += len(values)
+            return
+
+        end = self.size + len(values)
+        if end > len(self._data):
+            grown = self._allocate(kind, max(end, 2 * len(self._data)))
+            grown[:self.size] = self._data[:self.size]
+            self._data = grown
+        self._data[self.size:end] = self._encode(values)
+        self.size = end
+
+    def to_series(self, name):
+        if self.kind is None:
+            return pd.Series([None] * self.size, name=name, dtype=object)
+        data = self._data[:self.size]
+        if self.size < len(self._data):
+            # do not pin the spare capacity to the frame
+            data = data.copy()
+        if self.kind == 'category':
+            return pd.Series(pd.Categorical.from_codes(data, categories=list(self.categories)), name=name)
+        return pd.Series(data, name=name)
+
+    def reset(self):
+        """
+        forget the rows, the arrays are reallocated as the emitted frames may share them
+        """
+        self.size = 0
+        self.has_missing = False
+        if self.kind is not None:
+            self._data = self._allocate(self.kind, len(self._data))
+
+
+class FrameBuilder:
+    def __init__(self, include_id=False, columns=None):
+        """
+        :param include_id: add the _id of the hits as a column
+        :param columns: only keep these (flattened) fields, all of them if not set
+        """
+        self.include_id = include_id
+        self.columns = set(columns) if columns is not None else None
+        self.n_rows = 0
+        self._buffers = {}
+
+    def add_page(self, hits):
+        """
+        :param hits: ES hits, or _source dicts as loaded from a file_cache
+        """
+        n = len(hits)
+        page = {}
+        for i, hit in enumerate(hits):
+            row = flatten_source(hit['_source'] if '_source' in hit else hit)
+            if self.include_id:
+                row['_id'] = hit.get('_id')
+            for name, value in row.items():
+                if self.columns is not None and name not in self.columns and name != '_id':
+                    continue
+                values = page.get(name)
+                if values is None:
+                    values = page[name] = [None] * n
+                values[i] = value
+
+        for name in page:
+            if name not in self._buffers:
+                self._buffers[name] = ColumnBuffer(self.n_rows, categorical=name != '_id')
+        for name, buffer in self._buffers.items():
+            buffer.extend(page.get(name) or [None] * n)
+        self.n_rows += n
+
+    def to_frame(self):
+        return pd.DataFrame({name: buffer.to_series(name) for name, buffer in self._buffers.items()},
+                            index=pd.RangeIndex(self.n_rows))
+
+    def reset(self):
+        """
+        start a new frame, the columns and their categories are kept
+        """
+        self.n_rows = 0
+        for buffer in self._buffers.values():
+            buffer.reset()
+
+
+def scan_to_frames(pages, pages_per_frame=None, include_id=False, columns=None):
+    """
+    :param pages: iterable of lists of hits, e.g. scan_data_pages(...)
+    :param pages_per_frame: emit a DataFrame every pages_per_frame pages, a single final one if not set
+    :return: generator of DataFrames
+    """
+    builder = FrameBuilder(include_id, columns)
+    n_pages = 0
+    for hits in pages:
+        builder.add_page(hits)
+        n_pages += 1
+        if pages_per_frame and n_pages % pages_per_frame == 0:
+            yield builder.to_frame()
+            builder.reset()
+    if builder.n_rows or not pages_per_frame:
+        yield builder.to_frame()
+
+
+def scan_to_frame(pages, include_id=False, columns=None):
+    return next(scan_to_frames(pages, include_id=include_id, columns=columns))
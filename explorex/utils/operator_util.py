@@ -8,6 +8,7 @@ __all__ = [
     'drop',
     'iterate',
     'until_convergence',
+    'distance',
     'within_tolerance',
     'until_nearly_convergence'
 ]
@@ -33,9 +34,32 @@ def iterate(f, x):
     return accumulate(repeat(x), lambda fx, _: f(fx))
 
 
+def _is_array(x):
+    return hasattr(x, 'shape') and hasattr(x, 'dtype')
+
+
+def _same(prev, curr):
+    if _is_array(prev) or _is_array(curr):
+        import numpy as np
+        return np.array_equal(prev, curr)
+    return prev == curr
+
+
+def distance(prev, curr, norm=None):
+    """
+    abs(prev - curr) for numbers, the norm of the difference for array-valued states
+    :param norm: ord of numpy.linalg.norm, 2-norm of the flattened difference if not set
+    """
+    diff = curr - prev
+    if _is_array(diff):
+        import numpy as np
+        return np.linalg.norm(np.ravel(diff) if norm is None else diff, ord=norm)
+    return abs(diff)
+
+
 def until_convergence(it):
     def no_repeat(prev, curr):
-        if prev == curr:
+        if _same(prev, curr):
             raise StopIteration
         else:
             return curr
@@ -43,12 +67,12 @@ def until_convergence(it):
     return accumulate(it, no_repeat)
 
 
-def within_tolerance(tol, prev, curr):
-    if abs(prev - curr) < tol:
+def within_tolerance(tol, prev, curr, norm=None):
+    if distance(prev, curr, norm) < tol:
         raise StopIteration
     else:
         return curr
 
 
-def until_nearly_convergence(it, tolerance=0.001):
-    return accumulate(it, partial(within_tolerance, tolerance))
+def until_nearly_convergence(it, tolerance=0.001, norm=None):
+    return accumulate(it, partial(within_tolerance, tolerance, norm=norm))
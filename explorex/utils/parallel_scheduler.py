@@ -18,6 +18,8 @@ For groupby methods:
 7   http://pythonhosted.org/rosetta/_modules/rosetta/parallel/pandas_easy.html
 """
 
+from __future__ import annotations
+
 import itertools
 import multiprocessing
 import multiprocessing as mp
@@ -25,11 +27,11 @@ import time
 from functools import partial, wraps
 from typing import Callable, Tuple, Union
 
-import numpy as np
-import pandas as pd
-
 from explorex.utils.dataframe_util import flatten_any, flatten_array, normalize_json, implicit_to_counter
-from explorex.utils.basic_util import logger, deprecated
+from explorex.utils.basic_util import logger, deprecated, lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
 
 operator_map = {
     'normalize_json': normalize_json,
@@ -0,0 +1,210 @@
+"""
+lazy pipelines on top of operator_util: stages are only recorded until the pipeline is iterated, adjacent map / filter
+stages are fused into a single pass and, once batched, elements flow as numpy arrays so every stage is vectorized.
+e.g. streaming ES pages through a transformation chain without materializing intermediate lists:
+total = (Pipeline(hits)
+         .map(lambda hit: hit['_source']['duration'])
+         .filter(lambda d: d is not None)
+         .batch(10000)
+         .map(np.log1p)
+         .filter(lambda arr: arr > 0)
+         .reduce(lambda acc, arr: acc + arr.sum(), 0.0))
+"""
+
+from functools import reduce
+
+import numpy as np
+
+from explorex.utils.operator_util import drop, iterate, take, until_convergence, until_nearly_convergence
+
+
+def _fused(stages, batched):
+    """
+    one generator running a run of adjacent map / filter stages, instead of one generator per stage.
+    on batched streams a filter predicate returns a boolean mask over the batch
+    """
+
+    def run(it):
+        for x in it:
+            for kind, fn in stages:
+                if kind == 'map':
+                    x = fn(x)
+                elif batched:
+                    x = x[np.asarray(fn(x), dtype=bool)]
+                elif not fn(x):
+                    break
+            else:
+                if not batched or len(x):
+                    yield x
+
+    return run
+
+
+def _batch(size):
+    def run(it):
+        while True:
+            chunk = take(size, it)
+            if not chunk:
+                return
+            yield np.asarray(chunk)
+
+    return run
+
+
+def _rebatch(size):
+    def run(it):
+        buffered, n = [], 0
+        for arr in it:
+            buffered.append(arr)
+            n += len(arr)
+            if n >= size:
+                merged = np.concatenate(buffered)
+                stop = len(merged) - len(merged) % size
+                for start in range(0, stop, size):
+                    yield merged[start:start + size]
+                buffered, n = [merged[stop:]], len(merged) - stop
+        if n:
+            yield np.concatenate(buffered)
+
+    return run
+
+
+def _unbatch(it):
+    for arr in it:
+        yield from arr
+
+
+def _window(size, step, batched):
+    """
+    sliding windows of `size` consecutive elements every `step` elements, as (size, ...) arrays.
+    on batched streams the windows of a batch are emitted together as one (n_windows, size, ...) array and the tail
+    of every batch is carried over to the next one
+    """
+
+    def run(it):
+        if not batched:
+            it = _batch(max(size, 1024))(it)
+        carry, offset = None, 0
+        for arr in it:
+            arr = arr if carry is None else np.concatenate([carry, arr])
+            starts = np.arange(offset, len(arr) - size + 1, step)
+            if len(starts):
+                windows = arr[starts[:, np.newaxis] + np.arange(size)]
+                if batched:
+                    yield windows
+                else:
+                    yield from windows
+                offset = starts[-1] + step
+            carry = arr[min(offset, len(arr)):]
+            offset -= min(offset, len(arr))
+
+    return run
+
+
+class Pipeline:
+    def __init__(self, source, batched=False, stages=()):
+        """
+        :param source: any iterable, e.g. a generator of ES hits
+        :param batched: whether the elements of source already are numpy arrays (batches)
+        """
+        self._source = source
+        self._batched = batched
+        self._stages = tuple(stages)
+
+    @classmethod
+    def from_batches(cls, batches):
+        """
+        pipeline over an iterable of batches, e.g. ES scan pages, every batch becomes a numpy array
+        """
+        return cls((np.asarray(b) for b in batches), batched=True)
+
+    @classmethod
+    def iterate(cls, f, x):
+        """
+        pipeline over (x, f(x), f(f(x)), ...), array-valued states included
+        """
+        return cls(iterate(f, x))
+
+    def _then(self, kind, fn, batched=None):
+        """
+        every stage records whether it runs on batches, `batched` is the mode of the stages after it
+        """
+        return Pipeline(self._source, self._batched if batched is None else batched,
+                        self._stages + ((kind, fn, self._batched),))
+
+    def map(self, fn):
+        """
+        apply fn to every element, or to every batch once batched
+        """
+        return self._then('map', fn)
+
+    def filter(self, predicate):
+        """
+        keep the elements where predicate is true, once batched the predicate maps a batch to a boolean mask
+        """
+        return self._then('filter', predicate)
+
+    def batch(self, size):
+        """
+        group the elements into numpy arrays of `size` elements (the last one may be shorter), a batched stream is
+        re-batched to the new size
+        """
+        return self._then('op', _rebatch(size) if self._batched else _batch(size), batched=True)
+
+    def unbatch(self):
+        return self._then('op', _unbatch, batched=False) if self._batched else self
+
+    def window(self, size, step=1):
+        """
+        sliding windows over consecutive elements, see _window
+        """
+        return self._then('op', _window(size, step, self._batched))
+
+    def drop(self, n):
+        return self._then('op', lambda it: drop(n, it))
+
+    def until_convergence(self, tolerance=None, norm=None):
+        """
+        stop once two consecutive elements are equal, or closer than tolerance (norm of the difference for arrays)
+        """
+        if tolerance is None:
+            return self._then('op', until_convergence)
+        return self._then('op', lambda it: until_nearly_convergence(it, tolerance, norm))
+
+    def _compile(self):
+        """
+        :return: list of iterator -> iterator operators, runs of map / filter stages being fused
+        """
+        operators, run, run_batched = [], [], False
+        for kind, fn, batched in self._stages:
+            if kind in ('map', 'filter'):
+                run.append((kind, fn))
+                run_batched = batched
+                continue
+            if run:
+                operators.append(_fused(run, run_batched))
+                run = []
+            operators.append(fn)
+        if run:
+            operators.append(_fused(run, run_batched))
+        return operators
+
+    def __iter__(self):
+        it = iter(self._source)
+        for operator in self._compile():
+            it = operator(it)
+        return iter(it)
+
+    def take(self, n):
+        return take(n, iter(self))
+
+    def to_list(self):
+        return list(self)
+
+    def reduce(self, fn, initial=None):
+        """
+        terminal stage, fold the elements (or batches) with fn(accumulated, element)
+        """
+        if initial is None:
+            return reduce(fn, self)
+        return reduce(fn, self, initial)
@@ -0,0 +1,238 @@
+"""
+compressed block record store, the storage of file_cache: records are json lines grouped into blocks, every block
+compressed on its own (zstd or lz4 when installed, zlib otherwise) and listed in a block index at the end of the file.
+reading never needs the whole file in memory, records are decoded block by block and any block can be reached
+directly through the index. a store can be appended to, the new blocks go over the old index which is written again
+on close.
+
+layout:
+header  b'EXRS' | version (1 byte) | codec name length (1 byte) | codec name
+block   compressed length (uint32) | number of records (uint32) | compressed json lines
+footer  zlib compressed json list of [offset, number of records] per block | index offset (uint64) |
+        index length (uint32) | b'EXRI'
+a file without a valid footer (e.g. a writer that crashed) is read by walking the block headers.
+e.g.:
+with RecordWriter('hits.rec') as writer:
+    for hits in pages:
+        writer.write_many(hits)
+reader = RecordReader('hits.rec')
+for records in reader.iter_blocks(start=reader.block_of(250000)):
+    ...
+"""
+
+import json
+import os
+import struct
+import zlib
+
+MAGIC = b'EXRS'
+INDEX_MAGIC = b'EXRI'
+VERSION = 1
+
+_BLOCK_HEADER = struct.Struct('<II')
+_FOOTER = struct.Struct('<QI4s')
+
+
+def _zstd():
+    import zstandard
+    return zstandard.ZstdCompressor().compress, zstandard.ZstdDecompressor().decompress
+
+
+def _lz4():
+    import lz4.frame
+    return lz4.frame.compress, lz4.frame.decompress
+
+
+def _zlib():
+    return (lambda data: zlib.compress(data, 6)), zlib.decompress
+
+
+codec_map = {
+    'zstd': _zstd,
+    'lz4': _lz4,
+    'zlib': _zlib
+}
+
+
+def get_codec(name='auto'):
+    """
+    :param name: 'zstd', 'lz4', 'zlib' or 'auto', the first of them whose module is installed
+    :return: (name, compress, decompress)
+    """
+    if name == 'auto':
+        for candidate in ['zstd', 'lz4']:
+            try:
+                return (candidate,) + codec_map[candidate]()
+            except ImportError:
+                pass
+        name = 'zlib'
+    if name not in codec_map:
+        raise ValueError("codec should be one of {}, got {}".format(['auto'] + list(codec_map), name))
+    return (name,) + codec_map[name]()
+
+
+def is_record_store(path):
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _read_header(f):
+    head = f.read(len(MAGIC) + 2)
+    if len(head) < len(MAGIC) + 2 or head[:len(MAGIC)] != MAGIC:
+        raise ValueError("{} is not a record store".format(f.name))
+    if head[len(MAGIC)] != VERSION:
+        raise ValueError("unsupported record store version {}".format(head[len(MAGIC)]))
+    return f.read(head[len(MAGIC) + 1]).decode('ascii')
+
+
+def _read_index(f):
+    """
+    :return: (list of (offset, number of records), end of the last block)
+    """
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    if size >= _FOOTER.size:
+        f.seek(size - _FOOTER.size)
+        index_offset, index_length, magic = _FOOTER.unpack(f.read(_FOOTER.size))
+        if magic == INDEX_MAGIC and index_offset + index_length + _FOOTER.size == size:
+            f.seek(index_offset)
+            blocks = json.loads(zlib.decompress(f.read(index_length)).decode('utf-8'))
+            return [tuple(b) for b in blocks], index_offset
+
+    # no footer: walk the blocks, a truncated last block is dropped
+    f.seek(0)
+    _read_header(f)
+    blocks, offset = [], f.tell()
+    while offset + _BLOCK_HEADER.size <= size:
+        f.seek(offset)
+        length, n_records = _BLOCK_HEADER.unpack(f.read(_BLOCK_HEADER.size))
+        if offset + _BLOCK_HEADER.size + length > size:
+            break
+        blocks.append((offset, n_records))
+        offset += _BLOCK_HEADER.size + length
+    return blocks, offset
+
+
+class RecordWriter:
+    def __init__(self, path, codec='auto', block_records=10000, block_bytes=4 * 1024 * 1024, append=False):
+        """
+        :param codec: see get_codec, an appended store keeps its own codec
+        :param block_records: records per block
+        :param block_bytes: uncompressed bytes after which a block is closed, whatever its number of records
+        :param append: add blocks to an existing store instead of replacing it
+        """
+        self.path = path
+        self.block_records = block_records
+        self.block_bytes = block_bytes
+        if append and os.path.exists(path):
+            self._file = open(path, 'r+b')
+            codec = _read_header(self._file)
+            self.blocks, end = _read_index(self._file)
+            self._file.seek(end)
+            self._file.truncate()
+            self.codec, self._compress, _ = get_codec(codec)
+        else:
+            self.codec, self._compress, _ = get_codec(codec)
+            self._file = open(path, 'wb')
+            name = self.codec.encode('ascii')
+            self._file.write(MAGIC + bytes([VERSION, len(name)]) + name)
+            self.blocks = []
+        self._lines, self._size = [], 0
+
+    def write(self, record):
+        line = json.dumps(record).encode('utf-8')
+        self._lines.append(line)
+        self._size += len(line) + 1
+        if len(self._lines) >= self.block_records or self._size >= self.block_bytes:
+            self.flush_block()
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def flush_block(self):
+        if not self._lines:
+            return
+        payload = self._compress(b'\n'.join(self._lines))
+        self.blocks.append((self._file.tell(), len(self._lines)))
+        self._file.write(_BLOCK_HEADER.pack(len(payload), len(self._lines)))
+        self._file.write(payload)
+        self._lines, self._size = [], 0
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush_block()
+        index = zlib.compress(json.dumps(self.blocks).encode('utf-8'))
+        index_offset = self._file.tell()
+        self._file.write(index)
+        self._file.write(_FOOTER.pack(index_offset, len(index), INDEX_MAGIC))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RecordReader:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.codec = _read_header(f)
+            self.blocks, _ = _read_index(f)
+        _, _, self._decompress = get_codec(self.codec)
+        self._starts = [0]
+        for _, n_records in self.blocks:
+            self._starts.append(self._starts[-1] + n_records)
+
+    @property
+    def n_blocks(self):
+        return len(self.blocks)
+
+    @property
+    def n_records(self):
+        return self._starts[-1]
+
+    def block_of(self, record_number):
+        """
+        :return: index of the block holding the record_number-th record
+        """
+        if not 0 <= record_number < self.n_records:
+            raise IndexError("record {} out of {} records".format(record_number, self.n_records))
+        low, high = 0, len(self.blocks)
+        while high - low > 1:
+            middle = (low + high) // 2
+            if self._starts[middle] <= record_number:
+                low = middle
+            else:
+                high = middle
+        return low
+
+    def _decode(self, f, block):
+        offset, _ = self.blocks[block]
+        f.seek(offset)
+        length, _ = _BLOCK_HEADER.unpack(f.read(_BLOCK_HEADER.size))
+        return [json.loads(line) for line in self._decompress(f.read(length)).split(b'\n')]
+
+    def read_block(self, block):
+        with open(self.path, 'rb') as f:
+            return self._decode(f, block)
+
+    def iter_blocks(self, start=0, stop=None):
+        """
+        :return: generator of the lists of records of the blocks start .. stop - 1
+        """
+        with open(self.path, 'rb') as f:
+            for block in range(start, len(self.blocks) if stop is None else stop):
+                yield self._decode(f, block)
+
+    def __iter__(self):
+        for records in self.iter_blocks():
+            yield from records
+
+    def __len__(self):
+        return self.n_records
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# the fake ES server lives with the benchmarks
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+
+@pytest.fixture
+def fake_es():
+    pytest.importorskip('elasticsearch')
+    from fake_es import FakeESServer
+    with FakeESServer(n_docs=2000) as server:
+        yield server
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('elasticsearch')
+
+from explorex.dao import async_es_helper  # noqa: E402
+from explorex.dao.es_helper import get_client  # noqa: E402
+
+
+class _Leases:
+    def __init__(self, provider=None):
+        self.provider = provider
+        self.in_flight_at_release = None
+        self.acquired = self.released = 0
+
+    def acquire(self, port_map, factory):
+        self.acquired += 1
+
+    def release(self, port_map):
+        self.released += 1
+        self.in_flight_at_release = len(self.provider._tasks) + len(self.provider._pending)
+
+
+def test_close_sends_pending_gets_before_releasing(fake_es, monkeypatch):
+    leases = _Leases()
+    monkeypatch.setattr(async_es_helper, 'tunnel_manager', leases)
+
+    async def run():
+        provider = async_es_helper.AsyncESDataProvider('dev', mget_window=10)
+        provider._es = get_client(fake_es.address)
+        leases.provider = provider
+        await provider.open()
+        gets = [asyncio.ensure_future(provider._get('idx', 'doc', str(i))) for i in range(50)]
+        await asyncio.sleep(0)
+        await provider.close()
+        return await asyncio.gather(*gets)
+
+    docs = asyncio.run(run())
+    assert [d['_id'] for d in docs] == [str(i) for i in range(50)]
+    assert all(d['found'] for d in docs)
+    assert leases.in_flight_at_release == 0
+    assert fake_es.stats['mget'] == 1
+
+
+def test_requests_without_open_lease_the_tunnel_once(fake_es, monkeypatch):
+    leases = _Leases()
+    monkeypatch.setattr(async_es_helper, 'tunnel_manager', leases)
+
+    async def run():
+        provider = async_es_helper.AsyncESDataProvider('dev', mget_window=0.001, mget_max_batch=10)
+        provider._es = get_client(fake_es.address)
+        leases.provider = provider
+        docs = await asyncio.gather(*[provider._get('idx', 'doc', str(i)) for i in range(30)],
+                                    provider._search('idx', 'doc', {'size': 5}))
+        leased_while_running = leases.acquired
+        await provider.close()
+        return docs, leased_while_running
+
+    docs, leased_while_running = asyncio.run(run())
+    assert all(d['found'] for d in docs[:-1])
+    assert len(docs[-1]['hits']['hits']) == 5
+    assert leased_while_running == 1
+    assert leases.released == 1
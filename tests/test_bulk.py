@@ -0,0 +1,24 @@
+from datetime import datetime
+
+import numpy as np
+
+from explorex.dao.es_helper import batch_insert_data, iter_bulk_chunks
+
+
+def test_bulk_insert_numpy_and_datetime(fake_es):
+    docs = [{'_id': str(i), '_source': {'v': np.int64(i), 'x': np.float32(0.5), 'arr': np.arange(3),
+                                        't': datetime(2020, 1, 2, 3, 4, 5)}} for i in range(10)]
+    stats = batch_insert_data(fake_es.address, 'out', 'doc', iter(docs), chunk_size=4)
+
+    assert sum(c['ok'] for c in stats) == 10
+    assert sum(c['failed'] for c in stats) == 0
+    stored = fake_es.indexed['out']['3']
+    assert stored == {'v': 3, 'x': 0.5, 'arr': [0, 1, 2], 't': '2020-01-02T03:04:05'}
+
+
+def test_bulk_chunks_bounded_by_count_and_bytes():
+    docs = ({'_id': str(i), '_source': {'pad': 'x' * 100}} for i in range(50))
+    chunks = list(iter_bulk_chunks(docs, 'out', 'doc', chunk_size=20, max_chunk_bytes=1000))
+    assert sum(len(c) for c in chunks) == 50
+    assert all(len(c) <= 20 for c in chunks)
+    assert all(sum(len(a) + len(s) + 2 for a, s in c) <= 1000 for c in chunks)
@@ -0,0 +1,30 @@
+import os
+import signal
+
+import pytest
+
+from explorex.cluster.chain_runner import ChainRunner
+
+
+def draws(rng):
+    while True:
+        yield rng.random()
+
+
+def killed(rng):
+    os.kill(os.getpid(), signal.SIGKILL)
+    yield 0.0
+
+
+def test_run_all_shape():
+    assert ChainRunner(draws, 2, seed=1, n_jobs=1).run_all(20).shape == (2, 20)
+
+
+def test_unpicklable_sampler_raises():
+    with pytest.raises(RuntimeError, match='could not run'):
+        ChainRunner(lambda rng: iter(rng.random, None), 2, poll_interval=0.1).run_all(10)
+
+
+def test_killed_worker_raises():
+    with pytest.raises(RuntimeError, match='died'):
+        ChainRunner(killed, 1, poll_interval=0.1).run_all(10)
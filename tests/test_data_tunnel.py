@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+
+from explorex.dao.data_tunnel import PortMappingConf, TunnelManager
+
+
+class _Forwarder:
+    def __init__(self, port_map, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.is_active = False
+        self.starts = self.stops = 0
+
+    def start(self):
+        time.sleep(self.delay)
+        if self.fail:
+            raise OSError("could not connect")
+        self.starts += 1
+        self.is_active = True
+
+    def restart(self):
+        self.start()
+
+    def stop(self):
+        self.stops += 1
+        self.is_active = False
+
+
+def test_slow_handshake_does_not_block_other_tunnels():
+    manager = TunnelManager()
+    slow, fast = PortMappingConf('dev', 'es'), PortMappingConf('dev', 'mysql')
+    handshake = threading.Thread(target=manager.acquire, args=(slow, lambda p: _Forwarder(p, delay=1.0)))
+    handshake.start()
+    time.sleep(0.1)
+    start = time.time()
+    with manager.lease(fast, _Forwarder):
+        pass
+    assert time.time() - start < 0.5
+    handshake.join()
+    manager.close_all()
+
+
+def test_concurrent_acquires_share_one_tunnel():
+    manager = TunnelManager()
+    port_map = PortMappingConf('dev', 'es')
+    built = []
+
+    def factory(p):
+        built.append(_Forwarder(p, delay=0.2))
+        return built[-1]
+
+    servers = []
+    threads = [threading.Thread(target=lambda: servers.append(manager.acquire(port_map, factory))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(built) == 1 and built[0].starts == 1
+    assert all(s is built[0] for s in servers)
+    manager.close_all()
+    assert built[0].stops == 1
+
+
+def test_failed_handshake_is_retried():
+    manager = TunnelManager()
+    port_map = PortMappingConf('dev', 'redis')
+    with pytest.raises(OSError):
+        manager.acquire(port_map, lambda p: _Forwarder(p, fail=True))
+    with manager.lease(port_map, _Forwarder) as server:
+        assert server.is_active
+    manager.close_all()
@@ -0,0 +1,39 @@
+import numpy as np
+
+from explorex.cluster.dp_mixture import DPGaussianMixture, DPMeans
+
+
+def _blobs(n, k, d, seed=0, spread=0.3):
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(-10, 10, size=(k, d))
+    labels = rng.integers(k, size=n)
+    return centers[labels] + rng.normal(scale=spread, size=(n, d)), labels
+
+
+def _same_partition(a, b):
+    pairs = set(zip(a.tolist(), b.tolist()))
+    return len(pairs) == len(set(a.tolist())) == len(set(b.tolist()))
+
+
+def test_dp_gaussian_mixture_finds_the_clusters():
+    X, labels = _blobs(600, 3, 2)
+    dp = DPGaussianMixture(alpha=1, n_sweeps=20, random_state=0).fit(X)
+    assert dp.n_clusters_ == 3
+    assert _same_partition(dp.labels_, labels)
+    assert _same_partition(dp.predict(X), labels)
+
+
+def test_dp_means_opens_a_cluster_per_blob():
+    X, labels = _blobs(2000, 5, 3, seed=1)
+    dp = DPMeans(lam=4.0, random_state=0).fit(X)
+    assert dp.n_clusters_ == 5
+    assert _same_partition(dp.labels_, labels)
+    np.testing.assert_array_equal(dp.predict(X), dp.labels_)
+    assert dp.objective_ < DPMeans(lam=4.0, max_iter=1, random_state=0).fit(X).objective_ + 1e-9
+
+
+def test_dp_means_huge_penalty_keeps_one_cluster():
+    X, _ = _blobs(500, 3, 2)
+    dp = DPMeans(lam=1e9).fit(X)
+    assert dp.n_clusters_ == 1
+    np.testing.assert_allclose(dp.cluster_centers_[0], X.mean(axis=0))
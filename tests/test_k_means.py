@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from explorex.cluster.k_means_ import KMeans, MiniBatchKMeans, iter_batches
+
+
+def _blobs(n, k, d, seed=0, spread=0.3):
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(-10, 10, size=(k, d))
+    labels = rng.integers(k, size=n)
+    return centers[labels] + rng.normal(scale=spread, size=(n, d)), labels, centers
+
+
+def _same_partition(a, b):
+    # a bijection between the labels
+    pairs = set(zip(a.tolist(), b.tolist()))
+    return len(pairs) == len(set(a.tolist())) == len(set(b.tolist()))
+
+
+@pytest.mark.parametrize('algorithm', ['elkan', 'hamerly'])
+def test_pruned_algorithms_match_lloyd(algorithm):
+    X = np.random.default_rng(1).normal(size=(20000, 5))
+    init = X[np.random.default_rng(2).choice(len(X), 50, replace=False)]
+    lloyd = KMeans(50, init=init, algorithm='lloyd', tol=0, index='brute').fit(X)
+    pruned = KMeans(50, init=init, algorithm=algorithm, tol=0, index='brute').fit(X)
+    np.testing.assert_array_equal(pruned.labels_, lloyd.labels_)
+    np.testing.assert_allclose(pruned.cluster_centers_, lloyd.cluster_centers_)
+    assert pruned.n_iter_ == lloyd.n_iter_
+    assert pruned.inertia_ == pytest.approx(lloyd.inertia_)
+
+
+def test_kmeans_recovers_separated_blobs():
+    X, labels, centers = _blobs(3000, 4, 2)
+    km = KMeans(4, init='k-means++', n_init=3, n_jobs=1, random_state=0).fit(X)
+    assert _same_partition(km.labels_, labels)
+    np.testing.assert_allclose(np.sort(km.cluster_centers_, axis=0), np.sort(centers, axis=0), atol=0.05)
+    np.testing.assert_array_equal(km.predict(X), km.labels_)
+    assert len(km.n_init_stats_) == 3
+
+
+def test_minibatch_kmeans_streams_batches():
+    X, labels, centers = _blobs(20000, 3, 2, seed=3)
+    km = MiniBatchKMeans(3, init='k-means++', random_state=0).fit(iter_batches(X, 500))
+    assert km.n_samples_seen_ == len(X)
+    assert km.n_steps_ == 40
+    assert _same_partition(km.predict(X), labels)
+    np.testing.assert_allclose(np.sort(km.cluster_centers_, axis=0), np.sort(centers, axis=0), atol=0.05)
+
+
+def test_minibatch_kmeans_waits_for_enough_points():
+    km = MiniBatchKMeans(5, random_state=0)
+    km.partial_fit(np.zeros((2, 2)))
+    assert not hasattr(km, 'cluster_centers_')
+    with pytest.raises(ValueError):
+        MiniBatchKMeans(5).fit([np.zeros((2, 2))])
@@ -0,0 +1,74 @@
+import random
+import tracemalloc
+
+import numpy as np
+
+import pytest
+
+from explorex.cluster.non_parametric import PolyaUrn, crp_table_assignments, crp_table_counts, polya_urn_model, \
+    stick_breaking_weights
+
+
+def _model():
+    return polya_urn_model(random.random, num_balls=200, alpha=2)
+
+
+def test_polya_urn_model_follows_random_seed():
+    random.seed(7)
+    first = _model()
+    random.seed(7)
+    assert _model() == first
+    random.seed(8)
+    assert _model() != first
+
+
+def test_polya_urn_seeded():
+    first, second = PolyaUrn(lambda: 0.0, 1, random_state=3), PolyaUrn(lambda: 0.0, 1, random_state=3)
+    assert (first.draw(500) == second.draw(500)).all()
+
+
+def test_crp_blocks_seat_customers_in_opened_tables():
+    alpha, n = 2.0, 1000
+    assignments = crp_table_assignments(n, alpha, num_replicates=2000, random_state=0, block_size=5000)
+    assert assignments.shape == (2000, n) and assignments.dtype == np.int32
+    opened = np.maximum.accumulate(assignments, axis=1)
+    assert (assignments[:, 0] == 0).all()
+    assert (np.diff(opened, axis=1) <= 1).all()
+    num_tables = crp_table_counts(assignments).astype(bool).sum(axis=1)
+    expected = sum(alpha / (alpha + i) for i in range(n))
+    assert abs(num_tables.mean() - expected) < 0.3
+
+
+def test_crp_memory_bounded_by_the_block():
+    tracemalloc.start()
+    try:
+        assignments = crp_table_assignments(50000, 1.0, num_replicates=40, random_state=0, block_size=2 ** 16)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < assignments.nbytes + 2 ** 16 * 64
+
+
+def test_crp_shapes():
+    assert crp_table_assignments(5, 1, num_replicates=0).shape == (0, 5)
+    assert crp_table_assignments(5, 1).shape == (5,)
+    assert crp_table_assignments(0, 1).shape == (0,)
+    assert crp_table_assignments(0, 1, num_replicates=3).shape == (3, 0)
+
+
+def test_stick_breaking_weights_fixed_truncation():
+    weights = stick_breaking_weights(2000, 2.0, truncation=10, random_state=0)
+    assert weights.shape == (2000, 10)
+    assert (weights >= 0).all() and (weights.sum(axis=1) <= 1 + 1e-12).all()
+    # E[w_j] = (alpha / (1 + alpha)) ** j / (1 + alpha)
+    expected = (2.0 / 3.0) ** np.arange(10) / 3.0
+    np.testing.assert_allclose(weights.mean(axis=0), expected, atol=0.02)
+
+
+def test_stick_breaking_weights_tol_bounds_the_leftover():
+    weights = stick_breaking_weights(500, 5.0, tol=1e-4, random_state=1)
+    assert (1 - weights.sum(axis=1) < 1e-4).all()
+    # cut right after the first break where every draw is below tol
+    assert (1 - weights[:, :-1].sum(axis=1) >= 1e-4).any()
+    with pytest.raises(ValueError):
+        stick_breaking_weights(10, 1.0)
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from explorex.cluster.out_of_core import chunk_specs, open_chunk
+
+
+@pytest.fixture
+def npy(tmp_path):
+    path = str(tmp_path / 'x.npy')
+    np.save(path, np.arange(20000, dtype=float).reshape(10000, 2))
+    return path
+
+
+def test_sliced_memmap_chunks_read_the_sliced_rows(npy):
+    data = np.load(npy, mmap_mode='r')
+    for view in (data, data[6000:], data[6000:][10:20]):
+        chunks = [open_chunk(spec) for spec in chunk_specs(view, chunk_rows=1000)]
+        np.testing.assert_array_equal(np.concatenate(chunks), view)
+
+
+def test_strided_memmap_rejected(npy):
+    data = np.load(npy, mmap_mode='r')
+    with pytest.raises(ValueError):
+        chunk_specs(data[:, :1])
+    with pytest.raises(ValueError):
+        chunk_specs(data[::2])
@@ -0,0 +1,27 @@
+from explorex.dao.projection import project_query, required_fields
+from explorex.utils.aggregation_util import default_counter, time_aggregator
+from explorex.utils.dataframe_util import flatten_any
+from explorex.utils.parallel_scheduler import TaskBuilder
+
+QUERY = {'query': {'match_all': {}}}
+
+
+def test_fields_include_defaults_and_named_column_params():
+    tasks = TaskBuilder(None).add_tasks(flatten_any, ['user']).add_task(time_aggregator) \
+        .add_task(time_aggregator, time_col='ts').build_task()
+    fields = required_fields(tasks)
+    assert fields == ['time', 'ts', 'user']
+    assert project_query(QUERY, fields)['_source'] == {'includes': ['time', 'ts', 'user']}
+
+
+def test_positional_args_are_bound_to_their_params():
+    tasks = TaskBuilder(None).add_task(time_aggregator, '1d', 'ts').build_task()
+    assert required_fields(tasks, columns=['a']) == ['a', 'ts']
+
+
+def test_unknown_task_columns_keep_the_whole_source():
+    for task in [TaskBuilder(None).add_task(flatten_any), TaskBuilder(None).add_task(default_counter),
+                 TaskBuilder(None).add_task(lambda df, *args: df, 'x')]:
+        fields = required_fields(task.build_task(), columns=['a'])
+        assert fields == []
+        assert project_query(QUERY, fields) is QUERY
@@ -0,0 +1,111 @@
+import json
+import os
+
+import pytest
+
+from explorex.utils import file_util
+from explorex.utils.record_store import RecordReader, RecordWriter, get_codec, is_record_store
+
+RECORDS = [{'n': i, 'name': 'u{}'.format(i % 7), 'tags': [i, 'x'], 'nested': {'v': i / 3.0}} for i in range(2500)]
+
+
+def _write(path, records, **kwargs):
+    with RecordWriter(path, **kwargs) as writer:
+        writer.write_many(records)
+    return path
+
+
+@pytest.mark.parametrize('codec', ['auto', 'zlib'])
+def test_round_trip(tmp_path, codec):
+    path = _write(str(tmp_path / 'r.rec'), RECORDS, codec=codec, block_records=300)
+    assert is_record_store(path)
+    reader = RecordReader(path)
+    assert reader.codec == get_codec(codec)[0]
+    assert len(reader) == len(RECORDS)
+    assert reader.n_blocks == 9
+    assert list(reader) == RECORDS
+
+
+def test_block_bytes_closes_blocks(tmp_path):
+    path = _write(str(tmp_path / 'r.rec'), RECORDS, block_records=10 ** 6, block_bytes=4096)
+    reader = RecordReader(path)
+    assert reader.n_blocks > 1
+    assert list(reader) == RECORDS
+
+
+def test_block_of_and_read_block(tmp_path):
+    reader = RecordReader(_write(str(tmp_path / 'r.rec'), RECORDS, block_records=300))
+    for number in [0, 299, 300, 1234, len(RECORDS) - 1]:
+        block = reader.block_of(number)
+        assert block == number // 300
+        assert reader.read_block(block)[number % 300] == RECORDS[number]
+    assert [r for records in reader.iter_blocks(start=reader.block_of(1234)) for r in records] == RECORDS[1200:]
+    with pytest.raises(IndexError):
+        reader.block_of(len(RECORDS))
+
+
+def test_append_over_an_existing_footer(tmp_path):
+    path = _write(str(tmp_path / 'r.rec'), RECORDS[:1000], codec='zlib', block_records=300)
+    size = os.path.getsize(path)
+    _write(path, RECORDS[1000:], codec='auto', block_records=300, append=True)
+    reader = RecordReader(path)
+    # an appended store keeps its codec
+    assert reader.codec == 'zlib'
+    assert list(reader) == RECORDS
+    assert reader.n_blocks == 4 + 5
+    assert os.path.getsize(path) > size
+
+
+def test_recover_a_store_without_footer(tmp_path):
+    path = str(tmp_path / 'r.rec')
+    writer = RecordWriter(path, block_records=300)
+    writer.write_many(RECORDS)
+    # a crashed writer: the full blocks are on disk, the footer never was written
+    writer._file.flush()
+    reader = RecordReader(path)
+    assert list(reader) == RECORDS[:2400]
+    assert reader.n_blocks == 8
+
+    # a truncated last block is dropped
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 10)
+    assert list(RecordReader(path)) == RECORDS[:2100]
+
+    # and appending writes a footer again
+    _write(path, RECORDS[2100:], block_records=300, append=True)
+    assert list(RecordReader(path)) == RECORDS
+
+
+def test_not_a_record_store(tmp_path):
+    path = str(tmp_path / 'r.json')
+    with open(path, 'w') as f:
+        json.dump(RECORDS[:3], f)
+    assert not is_record_store(path)
+    with pytest.raises(ValueError):
+        RecordReader(path)
+
+
+def test_find_cache_file_falls_back_to_legacy_json(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    args = ('host', 'index', 'type', {'size': 10})
+    assert file_util.find_cache_file(args) is None
+    legacy = file_util.cache_filename(args, 'json')
+    file_util.save_json(legacy, RECORDS[:10])
+    assert file_util.find_cache_file(args) == legacy
+    assert file_util.load_cache(legacy) == RECORDS[:10]
+
+    fetched = []
+
+    @file_util.file_cache
+    def fetch(*args):
+        fetched.append(args)
+        return [{'_source': r} for r in RECORDS[10:20]]
+
+    # the legacy json cache is read instead of fetching
+    assert fetch(*args) == RECORDS[:10]
+    assert not fetched
+    # a records cache is preferred once it exists
+    file_util.save_cache(file_util.cache_filename(args), RECORDS[20:30])
+    assert file_util.find_cache_file(args).endswith('.rec')
+    assert fetch(*args) == RECORDS[20:30]
+    assert fetch(*args, cache_format='json') == RECORDS[:10]
@@ -0,0 +1,82 @@
+from collections import Counter
+
+import pytest
+
+from explorex.dao.es_helper import export_sliced_scroll, get_client, iter_sliced_scroll, scan_data_sliced
+from explorex.utils.file_util import iter_json
+
+QUERY = {'size': 50, 'query': {'match_all': {}}}
+
+
+class _FailingSlice:
+    """
+    client whose searches of one slice fail
+    """
+
+    def __init__(self, es, slice_id):
+        self._es = es
+        self.slice_id = slice_id
+
+    def search(self, **kwargs):
+        if kwargs.get('body', {}).get('slice', {}).get('id') == self.slice_id:
+            raise RuntimeError("slice {} failed".format(self.slice_id))
+        return self._es.search(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._es, name)
+
+
+def _ids(pages):
+    return Counter(hit['_id'] for hits in pages for hit in hits)
+
+
+def test_iter_sliced_scroll_yields_every_doc_once(fake_es):
+    ids = _ids(iter_sliced_scroll(get_client(fake_es.address), 'idx', 'doc', QUERY, 4))
+    assert set(ids) == {str(i) for i in range(fake_es.n_docs)}
+    assert set(ids.values()) == {1}
+    assert fake_es.scrolls == {}
+
+
+def test_scan_data_sliced_yields_every_doc_once(fake_es):
+    ids = _ids(scan_data_sliced(fake_es.address, 'idx', 'doc', QUERY, 3, no_cache=True))
+    assert set(ids) == {str(i) for i in range(fake_es.n_docs)}
+    assert set(ids.values()) == {1}
+
+
+def test_export_sliced_scroll_writes_every_doc_once(fake_es, tmp_path):
+    exported = export_sliced_scroll(get_client(fake_es.address), 'idx', 'doc', QUERY, 4, str(tmp_path))
+    assert len(exported) == 4
+    numbers = Counter()
+    for filename, count in exported:
+        docs = [doc for batch in iter_json(filename) for doc in batch]
+        assert len(docs) == count
+        numbers.update(doc['n'] for doc in docs)
+    assert set(numbers) == set(range(fake_es.n_docs))
+    assert set(numbers.values()) == {1}
+    assert fake_es.scrolls == {}
+
+
+@pytest.mark.parametrize('scan', ['iter_sliced_scroll', 'scan_data_sliced'])
+def test_early_close_clears_every_scroll(fake_es, scan):
+    if scan == 'iter_sliced_scroll':
+        pages = iter_sliced_scroll(get_client(fake_es.address), 'idx', 'doc', QUERY, 4, max_pending=1)
+    else:
+        pages = scan_data_sliced(fake_es.address, 'idx', 'doc', QUERY, 4, no_cache=True)
+    assert len(next(pages)) == QUERY['size']
+    assert fake_es.scrolls
+    pages.close()
+    assert fake_es.scrolls == {}
+
+
+def test_slice_error_is_raised_to_the_consumer(fake_es):
+    es = _FailingSlice(get_client(fake_es.address), slice_id=2)
+    with pytest.raises(RuntimeError, match='slice 2 failed'):
+        for _ in iter_sliced_scroll(es, 'idx', 'doc', QUERY, 4):
+            pass
+    assert fake_es.scrolls == {}
+
+
+def test_export_slice_error_is_raised(fake_es, tmp_path):
+    es = _FailingSlice(get_client(fake_es.address), slice_id=0)
+    with pytest.raises(RuntimeError, match='slice 0 failed'):
+        export_sliced_scroll(es, 'idx', 'doc', QUERY, 2, str(tmp_path))
@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+from explorex.cluster.spatial_index import KD_TREE_MAX_DIM, BruteForce, KDTree, build_index
+
+
+@pytest.mark.parametrize('d, expected', [(2, KDTree), (KD_TREE_MAX_DIM, KDTree), (KD_TREE_MAX_DIM + 1, BruteForce),
+                                         (40, BruteForce)])
+def test_auto_kind(d, expected):
+    pytest.importorskip('scipy')
+    assert type(build_index(np.zeros((4, d)))) is expected
+
+
+@pytest.mark.parametrize('kind', ['kd_tree', 'ball_tree', 'brute'])
+def test_kinds_agree(kind):
+    if kind == 'kd_tree':
+        pytest.importorskip('scipy')
+    rng = np.random.default_rng(0)
+    centers, points = rng.normal(size=(50, 5)), rng.normal(size=(500, 5))
+    expected = np.argmin(((points[:, np.newaxis] - centers) ** 2).sum(axis=2), axis=1)
+    np.testing.assert_array_equal(build_index(centers, kind).query(points)[1], expected)